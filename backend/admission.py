@@ -0,0 +1,219 @@
+"""
+Admission control for AgroGuard AI
+Per-user token-bucket rate limiting and fair-share scheduling of inference
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Hashable
+
+from fastapi import HTTPException, status
+
+from profiling import stage
+
+LANES = ("interactive", "bulk")
+
+
+class AdmissionRejected(HTTPException):
+    """Request refused for capacity reasons; carries a Retry-After header"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """One token bucket per key: refills at `rate` tokens a second up to `burst`
+
+    Buckets live in this process only and are touched from the event loop,
+    so no locking is needed. Full buckets are dropped periodically to keep
+    memory proportional to recently active users.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[Hashable, List[float]] = {}
+        self._calls = 0
+
+    def _bucket(self, key: Hashable, now: float) -> List[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def _prune(self, now: float):
+        refill_time = self.burst / self.rate if self.rate > 0 else math.inf
+        for key in [k for k, (_, updated) in self._buckets.items() if now - updated >= refill_time]:
+            del self._buckets[key]
+
+    def acquire(self, key: Hashable, cost: float = 1.0):
+        """Take `cost` tokens or raise AdmissionRejected (429) with the wait time"""
+        now = time.monotonic()
+        self._calls += 1
+        if self._calls % 1000 == 0:
+            self._prune(now)
+
+        bucket = self._bucket(key, now)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return
+        wait = (cost - bucket[0]) / self.rate if self.rate > 0 else 3600
+        raise AdmissionRejected(
+            status.HTTP_429_TOO_MANY_REQUESTS, "Rate limit exceeded, slow down", wait
+        )
+
+    def level(self, key: Hashable) -> float:
+        """Fraction of the bucket currently available (1.0 for unseen keys)"""
+        return self._bucket(key, time.monotonic())[0] / self.burst
+
+
+class FairScheduler:
+    """Share a fixed number of inference slots fairly across users
+
+    A request that finds every slot busy waits in its user's queue within
+    a lane. Each freed slot goes straight to the next waiter: lanes take
+    turns by weight (interactive 4 : bulk 1 by default, so bulk still moves)
+    and users within a lane are served round-robin, each getting `weight`
+    consecutive turns. One user's backlog therefore delays others by at
+    most a turn, not by the length of the backlog.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        lane_weights: Optional[Dict[str, int]] = None,
+        max_queue_per_user: int = 8,
+        max_wait: float = 30.0
+    ):
+        self.concurrency = concurrency
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        weights = lane_weights or {"interactive": 4, "bulk": 1}
+        self._cycle = [lane for lane in LANES for _ in range(max(1, weights.get(lane, 1)))]
+        self._cycle_pos = 0
+        self._lanes: Dict[str, "OrderedDict[Hashable, deque]"] = {lane: OrderedDict() for lane in LANES}
+        self._turns: Dict[Hashable, int] = {}
+        self._active = 0
+        self._service_time = 0.5
+
+    def _waiting(self) -> int:
+        return sum(len(queue) for users in self._lanes.values() for queue in users.values())
+
+    def estimated_wait(self) -> float:
+        """Seconds until a newly queued request would likely start"""
+        return (self._waiting() + 1) * self._service_time / self.concurrency
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for step in range(len(self._cycle)):
+            lane = self._cycle[(self._cycle_pos + step) % len(self._cycle)]
+            users = self._lanes[lane]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                while queue and queue[0][0].done():
+                    queue.popleft()
+                if not queue:
+                    del users[user_id]
+                    self._turns.pop((lane, user_id), None)
+                    continue
+
+                future, weight = queue.popleft()
+                turns = self._turns.get((lane, user_id), 0) + 1
+                if turns >= weight or not queue:
+                    users.move_to_end(user_id)
+                    turns = 0
+                if queue:
+                    self._turns[(lane, user_id)] = turns
+                else:
+                    del users[user_id]
+                    self._turns.pop((lane, user_id), None)
+                self._cycle_pos = (self._cycle_pos + step + 1) % len(self._cycle)
+                return future
+        return None
+
+    def _release(self):
+        future = self._next_waiter()
+        if future is None:
+            self._active -= 1
+        else:
+            # The slot passes directly to the waiter
+            future.set_result(None)
+
+    async def _acquire(self, user_id: Hashable, lane: str, weight: int):
+        if self._active < self.concurrency:
+            self._active += 1
+            return
+
+        queue = self._lanes[lane].setdefault(user_id, deque())
+        if len(queue) >= self.max_queue_per_user:
+            if not queue:
+                del self._lanes[lane][user_id]
+            raise AdmissionRejected(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "Too many requests waiting for inference",
+                self.estimated_wait()
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append((future, weight))
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(lane, user_id, future)
+            raise AdmissionRejected(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Inference is busy, try again later",
+                self.estimated_wait()
+            )
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Client went away just as the slot was handed over
+                self._release()
+            else:
+                self._discard(lane, user_id, future)
+            raise
+
+    def _discard(self, lane: str, user_id: Hashable, future: asyncio.Future):
+        queue = self._lanes[lane].get(user_id)
+        if queue is None:
+            return
+        for entry in queue:
+            if entry[0] is future:
+                queue.remove(entry)
+                break
+        if not queue:
+            del self._lanes[lane][user_id]
+            self._turns.pop((lane, user_id), None)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, lane: str = "interactive", weight: int = 1):
+        """Hold one inference slot for the duration of the block"""
+        with stage("queue"):
+            await self._acquire(user_id, lane, weight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "waiting": {
+                lane: sum(len(queue) for queue in users.values())
+                for lane, users in self._lanes.items()
+            },
+            "avg_service_ms": round(self._service_time * 1000, 1),
+        }
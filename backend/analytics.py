@@ -0,0 +1,198 @@
+"""
+Analytics module for AgroGuard AI
+Daily disease-prevalence rollups kept in a separate read-optimized SQLite file
+"""
+
+import os
+import sqlite3
+from typing import Optional, List, Dict, Any
+
+from database import get_connection
+
+ANALYTICS_DATABASE_PATH = os.getenv("ANALYTICS_DATABASE_PATH", "agroguard_analytics.db")
+
+# Predictions younger than this are left for the next rollup
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ANALYTICS_SETTLE_SECONDS", "60"))
+
+# Write-behind writers silent for longer than this are presumed dead and
+# no longer hold the rollup back
+WRITER_TIMEOUT_SECONDS = int(os.getenv("ANALYTICS_WRITER_TIMEOUT", "600"))
+
+# strftime formats used to group daily buckets into coarser periods
+TREND_BUCKETS = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+
+
+def get_analytics_connection():
+    """Get analytics database connection"""
+    conn = sqlite3.connect(ANALYTICS_DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_analytics_db():
+    """Initialize analytics tables"""
+    conn = get_analytics_connection()
+    cursor = conn.cursor()
+
+    # WAL lets trend queries read while a rollup is writing
+    cursor.execute("PRAGMA journal_mode=WAL")
+
+    # One row per (day, class); mean confidence = confidence_sum / count
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_disease_stats (
+            day TEXT NOT NULL,
+            predicted_class TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            confidence_sum REAL NOT NULL,
+            PRIMARY KEY (day, predicted_class)
+        ) WITHOUT ROWID
+    """)
+
+    # Rollup watermark: predictions created before this are aggregated
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+    conn.commit()
+    conn.close()
+
+
+def _get_watermark(cursor) -> Optional[str]:
+    cursor.execute("SELECT value FROM rollup_state WHERE key = 'rolled_up_before'")
+    row = cursor.fetchone()
+    return row["value"] if row else None
+
+
+def rollup_predictions(settle_seconds: int = ROLLUP_SETTLE_SECONDS) -> int:
+    """Fold newly settled predictions into the daily buckets
+
+    Works forward through `created_at` one day-sized window at a time. Ids
+    are not a safe watermark because write-behind commits rows out of id
+    order; instead only rows older than `settle_seconds` are rolled up,
+    and never past the low mark of a live write-behind writer, so a row
+    whose commit is held up (e.g. by a VACUUM) is counted once it lands.
+    Each window is one IMMEDIATE transaction on the analytics database
+    wrapped around a short indexed read on the main database, so concurrent
+    rollups from several workers serialise instead of double counting, and
+    `/predict` inserts are never held up behind a long scan. Returns the
+    number of predictions rolled up.
+    """
+    analytics = get_analytics_connection()
+    total = 0
+
+    try:
+        while True:
+            # Every API worker runs this loop; the watermark is read and
+            # advanced under one write lock so a window is counted only once
+            analytics.execute("BEGIN IMMEDIATE")
+            try:
+                watermark = _get_watermark(analytics.cursor())
+
+                conn = get_connection()
+                try:
+                    cutoff = conn.execute(
+                        "SELECT datetime('now', ?) AS cutoff", (f"-{settle_seconds} seconds",)
+                    ).fetchone()["cutoff"]
+                    low_mark = conn.execute(
+                        """SELECT MIN(low_mark) AS low_mark FROM write_behind_writers
+                           WHERE updated_at >= datetime('now', ?)""",
+                        (f"-{WRITER_TIMEOUT_SECONDS} seconds",)
+                    ).fetchone()["low_mark"]
+                    if low_mark is not None and low_mark < cutoff:
+                        cutoff = low_mark
+                    if watermark is None:
+                        watermark = conn.execute(
+                            "SELECT MIN(created_at) AS first FROM predictions"
+                        ).fetchone()["first"]
+                        if watermark is None:
+                            break
+                    if watermark >= cutoff:
+                        break
+
+                    window_end = conn.execute(
+                        "SELECT MIN(?, datetime(?, '+1 day')) AS window_end",
+                        (cutoff, watermark)
+                    ).fetchone()["window_end"]
+                    cursor = conn.execute(
+                        """SELECT date(created_at) AS day, predicted_class,
+                                  COUNT(*) AS count, SUM(confidence) AS confidence_sum
+                           FROM predictions
+                           WHERE created_at >= ? AND created_at < ?
+                           GROUP BY day, predicted_class""",
+                        (watermark, window_end)
+                    )
+                    buckets = [tuple(row) for row in cursor.fetchall()]
+                finally:
+                    conn.close()
+
+                analytics.executemany(
+                    """INSERT INTO daily_disease_stats (day, predicted_class, count, confidence_sum)
+                       VALUES (?, ?, ?, ?)
+                       ON CONFLICT (day, predicted_class) DO UPDATE SET
+                           count = count + excluded.count,
+                           confidence_sum = confidence_sum + excluded.confidence_sum""",
+                    buckets
+                )
+                analytics.execute(
+                    """INSERT INTO rollup_state (key, value) VALUES ('rolled_up_before', ?)
+                       ON CONFLICT (key) DO UPDATE SET value = excluded.value""",
+                    (window_end,)
+                )
+                analytics.commit()
+            finally:
+                if analytics.in_transaction:
+                    analytics.rollback()
+            total += sum(bucket[2] for bucket in buckets)
+    finally:
+        analytics.close()
+
+    return total
+
+
+def get_disease_trends(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    predicted_class: Optional[str] = None,
+    bucket: str = "day"
+) -> List[Dict[str, Any]]:
+    """Get prediction counts and mean confidence per class and period"""
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket}")
+
+    clauses = []
+    params: list = [TREND_BUCKETS[bucket]]
+    if start_date:
+        clauses.append("day >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("day <= ?")
+        params.append(end_date)
+    if predicted_class:
+        clauses.append("predicted_class = ?")
+        params.append(predicted_class)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = get_analytics_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        f"""SELECT strftime(?, day) AS period, predicted_class,
+                   SUM(count) AS count,
+                   SUM(confidence_sum) / SUM(count) AS mean_confidence
+            FROM daily_disease_stats
+            {where}
+            GROUP BY period, predicted_class
+            ORDER BY period, predicted_class""",
+        params
+    )
+    trends = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    return trends
@@ -0,0 +1,138 @@
+"""
+Async database access for AgroGuard AI
+Awaitable wrappers around database.py that run queries off the event loop
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
+
+import database
+from profiling import stage
+
+# Dedicated pool for SQLite work so queries never block the event loop or
+# compete with other run_in_threadpool users. Every call opens its own
+# connection, so threads never share one.
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="agroguard-db")
+
+
+async def _run(func, *args, **kwargs):
+    """Run a blocking database function on the database thread pool"""
+    loop = asyncio.get_running_loop()
+    with stage("db"):
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def create_user(email: str, username: str, password_hash: str) -> int:
+    """Create a new user"""
+    return await _run(database.create_user, email, username, password_hash)
+
+
+async def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
+    """Get user by email"""
+    return await _run(database.get_user_by_email, email)
+
+
+async def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get user by ID"""
+    return await _run(database.get_user_by_id, user_id)
+
+
+async def save_prediction(
+    user_id: int,
+    image_name: str,
+    predicted_class: str,
+    confidence: float,
+    treatment: str,
+    medicine: str
+) -> int:
+    """Save prediction to database"""
+    return await _run(
+        database.save_prediction,
+        user_id, image_name, predicted_class, confidence, treatment, medicine
+    )
+
+
+async def get_user_predictions(user_id: int) -> List[Dict[str, Any]]:
+    """Get all predictions for a user"""
+    return await _run(database.get_user_predictions, user_id)
+
+
+async def get_prediction_class_counts(
+    user_id: int,
+    prediction_ids: Optional[List[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> Dict[str, int]:
+    """Count a user's predictions per class"""
+    return await _run(
+        database.get_prediction_class_counts,
+        user_id, prediction_ids=prediction_ids, start_date=start_date, end_date=end_date
+    )
+
+
+async def get_user_data_version(user_id: int) -> int:
+    """Version counter of a user's predictions and reports"""
+    return await _run(database.get_user_data_version, user_id)
+
+
+async def get_prediction_by_id(prediction_id: int) -> Optional[Dict[str, Any]]:
+    """Get prediction by ID"""
+    return await _run(database.get_prediction_by_id, prediction_id)
+
+
+async def get_predictions_by_ids(prediction_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Get several predictions keyed by ID"""
+    return await _run(database.get_predictions_by_ids, prediction_ids)
+
+
+async def save_report(user_id: int, prediction_id: int, file_path: str) -> int:
+    """Save report to database"""
+    return await _run(database.save_report, user_id, prediction_id, file_path)
+
+
+async def get_report_for_prediction(prediction_id: int, template_version: int) -> Optional[Dict[str, Any]]:
+    """Get the cached report for a prediction rendered with a template version"""
+    return await _run(database.get_report_for_prediction, prediction_id, template_version)
+
+
+async def upsert_report(
+    user_id: int,
+    prediction_id: int,
+    template_version: int,
+    render_key: str,
+    file_path: str
+) -> int:
+    """Insert or replace the report for a (prediction, template version) pair"""
+    return await _run(
+        database.upsert_report,
+        user_id, prediction_id, template_version, render_key, file_path
+    )
+
+
+async def get_all_report_paths() -> List[str]:
+    """Get the file path of every report row"""
+    return await _run(database.get_all_report_paths)
+
+
+async def get_user_reports(user_id: int) -> List[Dict[str, Any]]:
+    """Get all reports for a user"""
+    return await _run(database.get_user_reports, user_id)
+
+
+async def get_report_by_id(report_id: int) -> Optional[Dict[str, Any]]:
+    """Get report by ID"""
+    return await _run(database.get_report_by_id, report_id)
+
+
+async def get_archived_file(path: str) -> Optional[Dict[str, Any]]:
+    """Get the archive entry of a file that was moved out of static/"""
+    return await _run(database.get_archived_file, path)
+
+
+async def get_maintenance_runs(limit: int = 10) -> List[Dict[str, Any]]:
+    """Get the most recent maintenance runs, newest first"""
+    return await _run(database.get_maintenance_runs, limit)
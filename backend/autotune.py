@@ -0,0 +1,214 @@
+"""
+Inference autotuner for AgroGuard AI
+Sweep TensorFlow thread pools, worker counts and batch sizes on this machine
+and write the fastest combination to inference_config.json
+
+Usage (from the backend directory):
+    python autotune.py                       # full sweep, writes inference_config.json
+    python autotune.py --affinity --max-latency-ms 250
+
+The file has one section per serving mode:
+    replicas  several model copies per node (in-process API workers, queue
+              workers): replica count and per-replica threads/pinning
+    shared    the single inference server of `serve.py --mode shared`:
+              best single-process threads, never pinned
+model_loader.load_keras_model applies the section for its mode at startup.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from itertools import product
+from typing import Dict, Any, List
+
+import numpy as np
+
+from model_loader import INFERENCE_CONFIG_PATH, MODEL_PATH
+
+
+def _probe(intra: int, inter: int, batch_sizes: List[int], duration: float, affinity: bool):
+    """Benchmark one worker process; runs inside a subprocess"""
+    import model_loader
+
+    model_loader.apply_inference_config({
+        "intra_op_threads": intra,
+        "inter_op_threads": inter,
+        "cpu_affinity": affinity,
+    })
+    model = model_loader.load_keras_model()
+    model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+
+    # Wait until every worker in this trial is loaded, then start together
+    print("READY", flush=True)
+    sys.stdin.readline()
+
+    results = {}
+    for batch_size in batch_sizes:
+        batch = np.random.rand(batch_size, 224, 224, 3).astype(np.float32)
+        model.predict(batch, verbose=0)
+        latencies = []
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            model.predict(batch, verbose=0)
+            latencies.append(time.perf_counter() - start)
+        results[batch_size] = {
+            "images_per_sec": batch_size * len(latencies) / sum(latencies),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        }
+    print("RESULT " + json.dumps(results), flush=True)
+
+
+def run_trial(workers: int, intra: int, inter: int, batch_sizes: List[int],
+              duration: float, affinity: bool) -> Dict[int, Dict[str, float]]:
+    """Run `workers` probe processes concurrently and aggregate their results"""
+    env = dict(os.environ, INFERENCE_CONFIG="")
+    for key in ("INFERENCE_SOCKET", "INFERENCE_QUEUE"):
+        env.pop(key, None)
+
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--probe",
+             "--intra", str(intra), "--inter", str(inter),
+             "--batch-sizes", *map(str, batch_sizes),
+             "--duration", str(duration)] + (["--affinity"] if affinity else []),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env
+        )
+        for _ in range(workers)
+    ]
+    try:
+        for proc in procs:
+            for line in proc.stdout:
+                if line.startswith("READY"):
+                    break
+        for proc in procs:
+            proc.stdin.write("GO\n")
+            proc.stdin.flush()
+
+        per_worker = []
+        for proc in procs:
+            for line in proc.stdout:
+                if line.startswith("RESULT "):
+                    per_worker.append(json.loads(line[len("RESULT "):]))
+                    break
+            proc.wait()
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+
+    if len(per_worker) != workers:
+        raise RuntimeError(f"Only {len(per_worker)}/{workers} probe workers reported")
+
+    return {
+        batch_size: {
+            "images_per_sec": sum(r[str(batch_size)]["images_per_sec"] for r in per_worker),
+            "p50_ms": max(r[str(batch_size)]["p50_ms"] for r in per_worker),
+            "p95_ms": max(r[str(batch_size)]["p95_ms"] for r in per_worker),
+        }
+        for batch_size in batch_sizes
+    }
+
+
+def _powers_of_two_up_to(limit: int) -> List[int]:
+    values, n = [], 1
+    while n <= limit:
+        values.append(n)
+        n *= 2
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune inference threading for this machine")
+    parser.add_argument("--output", default=INFERENCE_CONFIG_PATH or "inference_config.json")
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--intra", type=int, nargs="+", default=None)
+    parser.add_argument("--inter", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per batch size")
+    parser.add_argument("--max-latency-ms", type=float, default=None,
+                        help="Ignore configs whose p95 batch latency exceeds this")
+    parser.add_argument("--allow-oversubscription", action="store_true",
+                        help="Also try workers x intra threads > CPUs")
+    parser.add_argument("--affinity", action="store_true", help="Pin each worker to its own cores")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe(args.intra[0], args.inter[0], args.batch_sizes, args.duration, args.affinity)
+        return
+
+    if not os.path.exists(MODEL_PATH):
+        parser.error(f"Model file not found at {MODEL_PATH}")
+
+    cpus = len(os.sched_getaffinity(0))
+    # One worker is always measured: it is the shared server's setup
+    worker_options = sorted(set(args.workers or _powers_of_two_up_to(cpus)) | {1})
+    intra_options = args.intra or _powers_of_two_up_to(cpus)
+
+    trials = []
+    for workers, intra, inter in product(worker_options, intra_options, args.inter):
+        if workers * intra > cpus and not args.allow_oversubscription:
+            continue
+        print(f"[AUTOTUNE] workers={workers} intra={intra} inter={inter} ...", flush=True)
+        results = run_trial(workers, intra, inter, args.batch_sizes, args.duration, args.affinity)
+        for batch_size, metrics in results.items():
+            trials.append({
+                "workers": workers, "intra_op_threads": intra, "inter_op_threads": inter,
+                "batch_size": batch_size, **metrics,
+            })
+            print(f"    batch={batch_size:<3} {metrics['images_per_sec']:8.1f} img/s  "
+                  f"p95 {metrics['p95_ms']:7.1f} ms", flush=True)
+
+    eligible = [
+        t for t in trials
+        if args.max_latency_ms is None or t["p95_ms"] <= args.max_latency_ms
+    ]
+    if not eligible:
+        parser.error("No configuration met the latency limit")
+    best = max(eligible, key=lambda t: t["images_per_sec"])
+    single = [t for t in eligible if t["workers"] == 1]
+    best_single = max(single, key=lambda t: t["images_per_sec"]) if single else None
+
+    def measured(trial: Dict[str, Any]) -> Dict[str, float]:
+        return {key: trial[key] for key in ("images_per_sec", "p50_ms", "p95_ms")}
+
+    config = {
+        "replicas": {
+            "workers": best["workers"],
+            "intra_op_threads": best["intra_op_threads"],
+            "inter_op_threads": best["inter_op_threads"],
+            "batch_size": best["batch_size"],
+            "cpu_affinity": args.affinity,
+            "measured": measured(best),
+        },
+        "shared": {
+            "intra_op_threads": best_single["intra_op_threads"],
+            "inter_op_threads": best_single["inter_op_threads"],
+            "batch_size": best_single["batch_size"],
+            "measured": measured(best_single),
+        } if best_single else {},
+        "machine": {"cpus": cpus, "model": os.path.basename(MODEL_PATH)},
+        "trials": trials,
+    }
+    with open(args.output, "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"[AUTOTUNE] Best replicas: workers={best['workers']} intra={best['intra_op_threads']} "
+          f"inter={best['inter_op_threads']} batch={best['batch_size']} "
+          f"-> {best['images_per_sec']:.1f} img/s")
+    if best_single:
+        print(f"[AUTOTUNE] Best shared server: intra={best_single['intra_op_threads']} "
+              f"inter={best_single['inter_op_threads']} batch={best_single['batch_size']} "
+              f"-> {best_single['images_per_sec']:.1f} img/s")
+    print(f"[AUTOTUNE] Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Prediction insert benchmark for AgroGuard AI
+Compare per-row commits with the write-behind queue under concurrency
+
+Run from the backend directory:
+    python -m benchmarks.prediction_inserts --threads 32 --rows 200
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import database
+from write_behind import PredictionWriteBehind
+
+
+def _run_threads(threads: int, rows: int, insert) -> float:
+    """Run `insert` rows x threads times concurrently and return elapsed seconds"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(rows):
+            insert(1, f"bench_{i}.jpg", "Tomato___healthy", 0.99, "", "")
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - start
+
+
+def _save_with_retry(*args):
+    """save_prediction, retrying when the write lock is held by another thread"""
+    while True:
+        try:
+            return database.save_prediction(*args)
+        except Exception as e:
+            if "locked" not in str(e):
+                raise
+            time.sleep(0.001)
+
+
+def run(threads: int, rows: int, flush_rows: int, flush_interval_ms: int) -> dict:
+    """Benchmark both insert paths against a scratch database"""
+    scratch_dir = tempfile.mkdtemp(prefix="agroguard_bench_")
+    original_path = database.DATABASE_PATH
+    results = {}
+
+    try:
+        database.DATABASE_PATH = os.path.join(scratch_dir, "direct.db")
+        database.init_db()
+        elapsed = _run_threads(threads, rows, _save_with_retry)
+        results["direct"] = elapsed
+
+        database.DATABASE_PATH = os.path.join(scratch_dir, "write_behind.db")
+        database.init_db()
+        writer = PredictionWriteBehind(flush_rows=flush_rows, flush_interval_ms=flush_interval_ms)
+        writer.start()
+        start = time.perf_counter()
+        _run_threads(threads, rows, writer.submit)
+        submitted = time.perf_counter() - start
+        writer.close()
+        results["write_behind_submit"] = submitted
+        results["write_behind"] = time.perf_counter() - start
+    finally:
+        database.DATABASE_PATH = original_path
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prediction inserts")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent writers")
+    parser.add_argument("--rows", type=int, default=200, help="Rows per writer")
+    parser.add_argument("--flush-rows", type=int, default=64, help="Write-behind batch size")
+    parser.add_argument("--flush-ms", type=int, default=50, help="Write-behind flush interval")
+    args = parser.parse_args()
+
+    total = args.threads * args.rows
+    results = run(args.threads, args.rows, args.flush_rows, args.flush_ms)
+    print(f"Rows inserted          : {total} ({args.threads} threads)")
+    print(f"Direct commits         : {total / results['direct']:.0f} rows/sec")
+    print(f"Write-behind (durable) : {total / results['write_behind']:.0f} rows/sec")
+    print(f"Write-behind (submit)  : {total / results['write_behind_submit']:.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Report generation benchmark for AgroGuard AI
+Measure PDF reports/sec and peak Python memory for bulk exports
+
+Run from the backend directory:
+    python -m benchmarks.report_throughput --count 200 --image static/uploads/leaf.jpg
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from utils import report_generator
+
+
+def run(count: int, image_path: str) -> dict:
+    """Render `count` reports into a scratch directory and time them"""
+    scratch_dir = tempfile.mkdtemp(prefix="agroguard_bench_")
+    original_dir = report_generator.REPORTS_DIR
+    report_generator.REPORTS_DIR = scratch_dir
+
+    try:
+        # Warm-up render so font loading is not counted
+        report_generator.generate_pdf_report(
+            username="bench", image_path=image_path,
+            predicted_class="Tomato___Early_blight",
+            predicted_class_display="Tomato Early Blight",
+            confidence=0.9321, treatment="Remove lower leaves",
+            medicine="Mancozeb", date="2024-01-01 00:00:00"
+        )
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for i in range(count):
+            report_generator.generate_pdf_report(
+                username=f"bench_{i}", image_path=image_path,
+                predicted_class="Tomato___Early_blight",
+                predicted_class_display="Tomato Early Blight",
+                confidence=0.9321, treatment="Remove lower leaves",
+                medicine="Mancozeb", date="2024-01-01 00:00:00"
+            )
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        report_generator.REPORTS_DIR = original_dir
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return {
+        "reports": count,
+        "seconds": elapsed,
+        "reports_per_sec": count / elapsed if elapsed else float("inf"),
+        "peak_memory_mb": peak / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF report generation")
+    parser.add_argument("--count", type=int, default=100, help="Number of reports to render")
+    parser.add_argument("--image", default="", help="Optional image to embed in each report")
+    args = parser.parse_args()
+
+    if args.image and not os.path.exists(args.image):
+        parser.error(f"Image not found: {args.image}")
+
+    result = run(args.count, args.image)
+    print(f"Reports rendered : {result['reports']}")
+    print(f"Elapsed          : {result['seconds']:.2f}s")
+    print(f"Reports/sec      : {result['reports_per_sec']:.1f}")
+    print(f"Peak memory      : {result['peak_memory_mb']:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Serving memory benchmark for AgroGuard AI
+Measure cold-start time and per-worker memory for each serving mode and worker count
+
+Run from the backend directory:
+    python -m benchmarks.serving_memory --workers 1 2 4
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from serve import child_pids, process_memory
+
+
+def measure(mode: str, workers: int, port: int, timeout: float) -> dict:
+    """Launch serve.py and wait for every worker to finish startup"""
+    start = time.perf_counter()
+    launcher = subprocess.Popen(
+        [sys.executable, "serve.py", "--mode", mode, "--workers", str(workers),
+         "--port", str(port), "--host", "127.0.0.1",
+         "--socket", f"/tmp/agroguard-bench-{port}.sock"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+
+    ready = threading.Event()
+    started = []
+
+    def watch_output():
+        for line in launcher.stdout:
+            if "Application startup complete" in line:
+                started.append(line)
+                if len(started) >= workers:
+                    ready.set()
+
+    threading.Thread(target=watch_output, daemon=True).start()
+
+    try:
+        if not ready.wait(timeout):
+            raise TimeoutError(f"{mode} x{workers}: workers did not start within {timeout}s")
+        cold_start = time.perf_counter() - start
+
+        # Let allocators settle before sampling
+        time.sleep(2)
+        pids = child_pids(launcher.pid)
+        samples = [process_memory(pid) for pid in [launcher.pid] + pids]
+    finally:
+        launcher.terminate()
+        launcher.wait()
+
+    total_rss = sum(s["rss_mb"] for s in samples)
+    total_pss = sum(s["pss_mb"] for s in samples)
+    return {
+        "mode": mode,
+        "workers": workers,
+        "cold_start_s": cold_start,
+        "processes": len(samples),
+        "total_rss_mb": total_rss,
+        "total_pss_mb": total_pss,
+        "pss_per_worker_mb": total_pss / workers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serving memory and cold start")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", default=["in-process", "shared"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    if not os.path.exists("serve.py"):
+        parser.error("Run from the backend directory")
+
+    print(f"{'mode':<11} {'workers':>7} {'cold start':>10} {'procs':>5} "
+          f"{'RSS MB':>8} {'PSS MB':>8} {'PSS/worker':>10}")
+    for mode in args.modes:
+        for workers in args.workers:
+            r = measure(mode, workers, args.port, args.timeout)
+            print(f"{r['mode']:<11} {r['workers']:>7} {r['cold_start_s']:>9.1f}s {r['processes']:>5} "
+                  f"{r['total_rss_mb']:>8.0f} {r['total_pss_mb']:>8.0f} {r['pss_per_worker_mb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
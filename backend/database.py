@@ -5,8 +5,9 @@ SQLite database initialization and operations
 
 import sqlite3
 import os
+import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 
 DATABASE_PATH = "agroguard.db"
 
@@ -62,10 +63,91 @@ def init_db():
         )
     """)
 
+    # Time-range scans (exports, field reports, analytics rollups)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_predictions_created_at
+        ON predictions (created_at)
+    """)
+
+    # Report cache columns (added after the initial schema)
+    _ensure_column(cursor, "reports", "template_version", "INTEGER")
+    _ensure_column(cursor, "reports", "render_key", "TEXT")
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_reports_prediction_template
+        ON reports (prediction_id, template_version)
+    """)
+
+    # Per-user data version for HTTP ETags, bumped by triggers on every
+    # change to a user's predictions or reports
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table, event, row in (
+        ("predictions", "INSERT", "NEW"),
+        ("predictions", "DELETE", "OLD"),
+        ("reports", "INSERT", "NEW"),
+        ("reports", "UPDATE", "NEW"),
+        ("reports", "DELETE", "OLD"),
+    ):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS bump_version_{table}_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO user_data_versions (user_id, version) VALUES ({row}.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
+        """)
+
+    # Files moved out of static/ into archive bundles by maintenance.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archived_files (
+            path TEXT PRIMARY KEY,
+            bundle TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archived_files_bundle
+        ON archived_files (bundle)
+    """)
+
+    # Oldest created_at each live write-behind writer may still commit;
+    # the analytics rollup never moves its watermark past the lowest one
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS write_behind_writers (
+            writer TEXT PRIMARY KEY,
+            low_mark TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Outcome of each maintenance run
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP NOT NULL,
+            trigger TEXT NOT NULL,
+            report TEXT NOT NULL
+        )
+    """)
+
     conn.commit()
     conn.close()
 
 
+def _ensure_column(cursor, table: str, column: str, declaration: str):
+    """Add a column to an existing table if it is missing"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row["name"] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
 def seed_demo_user():
     """Create demo user if it doesn't exist"""
     from auth import hash_password
@@ -159,6 +241,100 @@ def save_prediction(
     return prediction_id
 
 
+def reserve_prediction_ids(count: int) -> int:
+    """Reserve a block of `count` prediction ids and return the first one
+
+    Bumps the AUTOINCREMENT counter so ids handed out ahead of the insert
+    never clash with other processes or with plain `save_prediction` calls.
+    """
+    conn = get_connection()
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'")
+        row = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM predictions")
+        current = max(row["seq"] if row else 0, cursor.fetchone()["max_id"])
+        
+        if row:
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = ? WHERE name = 'predictions'",
+                (current + count,)
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('predictions', ?)",
+                (current + count,)
+            )
+        cursor.execute("COMMIT")
+    except Exception:
+        # BEGIN itself fails when the database is locked; keep that error
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    
+    return current + 1
+
+
+_UPSERT_WRITER = """INSERT INTO write_behind_writers (writer, low_mark, updated_at)
+                     VALUES (?, ?, CURRENT_TIMESTAMP)
+                     ON CONFLICT (writer) DO UPDATE SET
+                         low_mark = excluded.low_mark,
+                         updated_at = excluded.updated_at"""
+
+
+def save_predictions_batch(
+    rows: List[Dict[str, Any]],
+    writer: Optional[str] = None,
+    low_mark: Optional[str] = None
+):
+    """Insert predictions with pre-assigned ids in a single transaction
+
+    With `writer`, its low mark is updated in the same transaction.
+    """
+    conn = get_connection()
+    
+    try:
+        with conn:
+            conn.executemany(
+                """INSERT INTO predictions
+                   (id, user_id, image_name, predicted_class, confidence, treatment, medicine, created_at)
+                   VALUES (:id, :user_id, :image_name, :predicted_class, :confidence,
+                           :treatment, :medicine, :created_at)""",
+                rows
+            )
+            if writer is not None:
+                conn.execute(_UPSERT_WRITER, (writer, low_mark))
+    finally:
+        conn.close()
+
+
+def set_writer_low_mark(writer: str, low_mark: str):
+    """Record the oldest created_at a write-behind writer may still commit"""
+    conn = get_connection()
+    
+    try:
+        with conn:
+            conn.execute(_UPSERT_WRITER, (writer, low_mark))
+    finally:
+        conn.close()
+
+
+def remove_writer(writer: str):
+    """Forget a write-behind writer that has committed everything and stopped"""
+    conn = get_connection()
+    
+    try:
+        with conn:
+            conn.execute("DELETE FROM write_behind_writers WHERE writer = ?", (writer,))
+    finally:
+        conn.close()
+
+
 def get_user_predictions(user_id: int) -> List[Dict[str, Any]]:
     """Get all predictions for a user"""
     conn = get_connection()
@@ -174,6 +350,127 @@ def get_user_predictions(user_id: int) -> List[Dict[str, Any]]:
     return predictions
 
 
+def _prediction_filter(
+    user_id: int,
+    prediction_ids: Optional[List[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    predicted_class: Optional[str] = None
+) -> Tuple[str, list]:
+    """Build the WHERE clause selecting a user's predictions by ids, date range and class"""
+    clauses = ["user_id = ?"]
+    params: list = [user_id]
+    
+    if prediction_ids is not None:
+        # json_each avoids SQLite's bound-parameter limit for long id lists
+        clauses.append("id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(i) for i in prediction_ids]))
+    if start_date:
+        clauses.append("created_at >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("created_at < date(?, '+1 day')")
+        params.append(end_date)
+    if predicted_class:
+        clauses.append("predicted_class = ?")
+        params.append(predicted_class)
+    
+    return " AND ".join(clauses), params
+
+
+def _iter_prediction_pages(where: str, params: list, page_size: int) -> Iterator[List[sqlite3.Row]]:
+    """Yield matching predictions (oldest first) a page at a time
+
+    Pages are read by keyset on (created_at, id), each on its own short-lived
+    connection closed before the page is yielded, so a slow consumer never
+    holds a read lock that would block writers.
+    """
+    last = None
+    while True:
+        clause, page_params = where, list(params)
+        if last is not None:
+            clause += " AND (created_at, id) > (?, ?)"
+            page_params += [last["created_at"], last["id"]]
+        conn = get_connection()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM predictions WHERE {clause} ORDER BY created_at, id LIMIT ?",
+                page_params + [page_size]
+            ).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+
+
+def iter_user_predictions(
+    user_id: int,
+    prediction_ids: Optional[List[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = 500
+) -> Iterator[Dict[str, Any]]:
+    """Lazily yield a user's predictions (oldest first) without loading them all"""
+    where, params = _prediction_filter(user_id, prediction_ids, start_date, end_date)
+    for rows in _iter_prediction_pages(where, params, page_size):
+        for row in rows:
+            yield dict(row)
+
+
+def iter_user_prediction_batches(
+    user_id: int,
+    batch_size: int = 1000,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    predicted_class: Optional[str] = None
+) -> Iterator[List[sqlite3.Row]]:
+    """Yield a user's predictions in fixed-size batches
+
+    No connection stays open between batches, so batches can be pulled from
+    different threads, as a streaming response does through a threadpool.
+    """
+    where, params = _prediction_filter(
+        user_id, start_date=start_date, end_date=end_date, predicted_class=predicted_class
+    )
+    return _iter_prediction_pages(where, params, batch_size)
+
+
+def get_prediction_class_counts(
+    user_id: int,
+    prediction_ids: Optional[List[int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> Dict[str, int]:
+    """Count a user's predictions per class for the same filters as iter_user_predictions"""
+    where, params = _prediction_filter(user_id, prediction_ids, start_date, end_date)
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        f"SELECT predicted_class, COUNT(*) AS count FROM predictions WHERE {where} GROUP BY predicted_class",
+        params
+    )
+    counts = {row["predicted_class"]: row["count"] for row in cursor.fetchall()}
+    conn.close()
+    
+    return counts
+
+
+def get_user_data_version(user_id: int) -> int:
+    """Version counter of a user's predictions and reports"""
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT version FROM user_data_versions WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    conn.close()
+    
+    return row["version"] if row else 0
+
+
 def get_prediction_by_id(prediction_id: int) -> Optional[Dict[str, Any]]:
     """Get prediction by ID"""
     conn = get_connection()
@@ -186,6 +483,18 @@ def get_prediction_by_id(prediction_id: int) -> Optional[Dict[str, Any]]:
     return dict(prediction) if prediction else None
 
 
+def get_predictions_by_ids(prediction_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Get several predictions keyed by ID; missing IDs are left out"""
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT * FROM predictions WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps([int(i) for i in prediction_ids]),)
+    ).fetchall()
+    conn.close()
+    
+    return {row["id"]: dict(row) for row in rows}
+
+
 def save_report(user_id: int, prediction_id: int, file_path: str) -> int:
     """Save report to database"""
     conn = get_connection()
@@ -203,6 +512,66 @@ def save_report(user_id: int, prediction_id: int, file_path: str) -> int:
     return report_id
 
 
+def get_report_for_prediction(prediction_id: int, template_version: int) -> Optional[Dict[str, Any]]:
+    """Get the cached report for a prediction rendered with a template version"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "SELECT * FROM reports WHERE prediction_id = ? AND template_version = ?",
+        (prediction_id, template_version)
+    )
+    report = cursor.fetchone()
+    conn.close()
+    
+    return dict(report) if report else None
+
+
+def upsert_report(
+    user_id: int,
+    prediction_id: int,
+    template_version: int,
+    render_key: str,
+    file_path: str
+) -> int:
+    """Insert or replace the report for a (prediction, template version) pair"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        """INSERT INTO reports
+           (user_id, prediction_id, file_path, template_version, render_key)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (prediction_id, template_version) DO UPDATE SET
+               file_path = excluded.file_path,
+               render_key = excluded.render_key,
+               created_at = CURRENT_TIMESTAMP""",
+        (user_id, prediction_id, file_path, template_version, render_key)
+    )
+    cursor.execute(
+        "SELECT id FROM reports WHERE prediction_id = ? AND template_version = ?",
+        (prediction_id, template_version)
+    )
+    report_id = cursor.fetchone()["id"]
+    
+    conn.commit()
+    conn.close()
+    
+    return report_id
+
+
+def get_all_report_paths() -> List[str]:
+    """Get the file path of every report row"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT file_path FROM reports")
+    paths = [row["file_path"] for row in cursor.fetchall()]
+    conn.close()
+    
+    return paths
+
+
 def get_user_reports(user_id: int) -> List[Dict[str, Any]]:
     """Get all reports for a user"""
     conn = get_connection()
@@ -232,3 +601,68 @@ def get_report_by_id(report_id: int) -> Optional[Dict[str, Any]]:
     conn.close()
     
     return dict(report) if report else None
+
+
+def record_archived_files(bundle: str, files: List[Tuple[str, int, float]]):
+    """Index (path, size, mtime) of files written to an archive bundle"""
+    conn = get_connection()
+    conn.executemany(
+        """INSERT OR REPLACE INTO archived_files (path, bundle, size, mtime)
+           VALUES (?, ?, ?, ?)""",
+        [(path, bundle, size, mtime) for path, size, mtime in files]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_archived_file(path: str) -> Optional[Dict[str, Any]]:
+    """Get the archive entry of a file that was moved out of static/"""
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT * FROM archived_files WHERE path = ?", (os.path.normpath(path),)
+    ).fetchone()
+    conn.close()
+    
+    return dict(row) if row else None
+
+
+def delete_archived_bundle(bundle: str) -> int:
+    """Forget every file stored in a deleted bundle"""
+    conn = get_connection()
+    deleted = conn.execute("DELETE FROM archived_files WHERE bundle = ?", (bundle,)).rowcount
+    conn.commit()
+    conn.close()
+    
+    return deleted
+
+
+def save_maintenance_run(started_at: str, finished_at: str, trigger: str, report: Dict[str, Any]) -> int:
+    """Save the report of a maintenance run"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "INSERT INTO maintenance_runs (started_at, finished_at, trigger, report) VALUES (?, ?, ?, ?)",
+        (started_at, finished_at, trigger, json.dumps(report))
+    )
+    conn.commit()
+    run_id = cursor.lastrowid
+    conn.close()
+    
+    return run_id
+
+
+def get_maintenance_runs(limit: int = 10, trigger: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get the most recent maintenance runs, newest first, optionally of one trigger"""
+    conn = get_connection()
+    if trigger:
+        rows = conn.execute(
+            "SELECT * FROM maintenance_runs WHERE trigger = ? ORDER BY id DESC LIMIT ?", (trigger, limit)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+    conn.close()
+    
+    return [dict(row, report=json.loads(row["report"])) for row in rows]
@@ -0,0 +1,293 @@
+"""
+Similar-case index for AgroGuard AI
+Keep prediction embeddings in a memory-mapped float16 matrix and search
+them with an IVF (inverted file) index in pure NumPy
+"""
+
+import fcntl
+import json
+import os
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "embeddings")
+
+# Below this many rows an exact scan is fast enough and no index is trained
+TRAIN_MIN_ROWS = int(os.getenv("EMBEDDING_TRAIN_MIN_ROWS", "20000"))
+
+# Lists scanned per query; more is slower but finds more true neighbours
+DEFAULT_NPROBE = int(os.getenv("EMBEDDING_NPROBE", "8"))
+
+_CHUNK_ROWS = 16384
+
+# Rows appended since the id lookup was last merged are scanned directly
+_ID_TAIL_ROWS = 1024
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by dot product) of each row, in chunks"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + _CHUNK_ROWS], dtype=np.float32)
+        lists[start:start + len(chunk)] = (chunk @ centroids.T).argmax(axis=1)
+    return lists
+
+
+class EmbeddingIndex:
+    """Append-only embedding store with an IVF nearest-neighbour index
+
+    Files in `directory`:
+        vectors.f16    N x dim float16, L2-normalised so cosine = dot product
+        ids.i64        prediction id of each row
+        lists.i32      IVF list of each row (-1 before an index is trained)
+        centroids.npy  nlist x dim coarse quantiser
+        meta.json      dim, index version and rows covered by training
+
+    Appends hold an flock, so API workers can share one directory; readers
+    map whichever rows are complete. Each process groups rows by list with
+    one argsort and scans rows added since then directly, so a query reads
+    only the `nprobe` closest lists instead of the whole matrix.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Any] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._rows = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._lists: Optional[np.ndarray] = None
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._sorted_rows = 0
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._id_order: Optional[np.ndarray] = None
+        self._id_rows = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # ---------------- STATE ---------------- #
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"dim": None, "version": 0, "trained_rows": 0}
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path("meta.json"))
+
+    def _load_meta(self):
+        """Pick up a retrained index written by any process"""
+        meta = self._read_meta()
+        if meta.get("version") != self._meta.get("version"):
+            self._centroids = np.load(self._path("centroids.npy")) if meta.get("version") else None
+            self._rows = 0
+            self._order = None
+            self._sorted_rows = 0
+        self._meta = meta
+
+    def _complete_rows(self) -> int:
+        dim = self._meta.get("dim")
+        if not dim:
+            return 0
+        sizes = []
+        for name, itemsize in (("vectors.f16", 2 * dim), ("lists.i32", 4), ("ids.i64", 8)):
+            try:
+                sizes.append(os.path.getsize(self._path(name)) // itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(sizes)
+
+    def _refresh(self):
+        """Map rows appended since the last call"""
+        self._load_meta()
+        rows = self._complete_rows()
+        if rows != self._rows:
+            dim = self._meta["dim"]
+            self._vectors = np.memmap(self._path("vectors.f16"), dtype=np.float16, mode="r", shape=(rows, dim))
+            self._ids = np.memmap(self._path("ids.i64"), dtype=np.int64, mode="r", shape=(rows,))
+            self._lists = np.memmap(self._path("lists.i32"), dtype=np.int32, mode="r", shape=(rows,))
+            self._rows = rows
+
+        # Regroup rows by list once the unsorted tail gets long
+        if self._centroids is not None and self._rows - self._sorted_rows > max(4096, self._rows // 20):
+            lists = np.asarray(self._lists)
+            self._order = np.argsort(lists, kind="stable").astype(np.int64)
+            counts = np.bincount(lists[lists >= 0], minlength=len(self._centroids))
+            self._offsets = np.concatenate(([0], np.cumsum(counts))) + np.count_nonzero(lists < 0)
+            self._sorted_rows = self._rows
+
+        # Merge new rows into the id-sorted lookup; ids.i64 is append-only
+        if self._rows - self._id_rows > _ID_TAIL_ROWS:
+            tail = np.asarray(self._ids[self._id_rows:self._rows])
+            tail_order = np.argsort(tail, kind="stable")
+            tail_ids = tail[tail_order]
+            if self._sorted_ids is None:
+                self._sorted_ids, self._id_order = tail_ids, tail_order.astype(np.int64)
+            else:
+                at = np.searchsorted(self._sorted_ids, tail_ids, side="right")
+                self._sorted_ids = np.insert(self._sorted_ids, at, tail_ids)
+                self._id_order = np.insert(self._id_order, at, tail_order + self._id_rows)
+            self._id_rows = self._rows
+
+    def _row_of(self, prediction_id: int) -> Optional[int]:
+        """Latest row holding `prediction_id`, without scanning every id"""
+        tail = np.flatnonzero(self._ids[self._id_rows:self._rows] == prediction_id)
+        if len(tail):
+            return self._id_rows + int(tail[-1])
+        if self._sorted_ids is not None:
+            pos = int(np.searchsorted(self._sorted_ids, prediction_id, side="right")) - 1
+            if pos >= 0 and self._sorted_ids[pos] == prediction_id:
+                return int(self._id_order[pos])
+        return None
+
+    # ---------------- WRITE ---------------- #
+
+    def add(self, prediction_id: int, embedding: List[float]):
+        """Append one prediction's embedding"""
+        vector = _normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock, open(self._path("lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load_meta()
+            if self._meta.get("dim") is None:
+                self._meta["dim"] = len(vector)
+                self._write_meta(self._meta)
+            elif self._meta["dim"] != len(vector):
+                raise ValueError(f"Embedding has {len(vector)} dims, index expects {self._meta['dim']}")
+
+            list_id = -1
+            if self._centroids is not None:
+                list_id = int((self._centroids @ vector).argmax())
+
+            # ids last: a row counts as complete once all three are written
+            with open(self._path("vectors.f16"), "ab") as f:
+                f.write(vector.astype(np.float16).tobytes())
+            with open(self._path("lists.i32"), "ab") as f:
+                f.write(np.int32(list_id).tobytes())
+            with open(self._path("ids.i64"), "ab") as f:
+                f.write(np.int64(prediction_id).tobytes())
+
+    def train(self, nlist: Optional[int] = None, sample_size: int = 32768,
+              iterations: int = 10, seed: int = 0) -> bool:
+        """(Re)build the IVF quantiser with spherical k-means and reassign every row
+
+        Only one process trains at a time; returns False if another is
+        already training or there are too few rows.
+        """
+        with open(self._path("train.lock"), "w") as train_lock:
+            try:
+                fcntl.flock(train_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+            with self._lock:
+                self._refresh()
+                rows, vectors = self._rows, self._vectors
+            if rows < TRAIN_MIN_ROWS:
+                return False
+
+            nlist = nlist or int(np.clip(np.sqrt(rows), 16, 1024))
+            rng = np.random.default_rng(seed)
+            sample_idx = np.sort(rng.choice(rows, size=min(rows, max(sample_size, 40 * nlist)), replace=False))
+            sample = np.asarray(vectors[sample_idx], dtype=np.float32)
+
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = _assign(sample, centroids)
+                counts = np.bincount(assignment, minlength=nlist)
+                filled = counts > 0
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+                sums = np.add.reduceat(sample[np.argsort(assignment, kind="stable")], starts, axis=0)
+                centroids[filled] = _normalize(sums)
+
+            lists = _assign(vectors, centroids)
+
+            with self._lock, open(self._path("lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._refresh()
+                # Rows appended while training ran
+                tail = _assign(self._vectors[rows:], centroids)
+                tmp = self._path("lists.i32.tmp")
+                with open(tmp, "wb") as f:
+                    f.write(lists.tobytes())
+                    f.write(tail.tobytes())
+                np.save(self._path("centroids.npy"), centroids.astype(np.float32))
+                os.replace(tmp, self._path("lists.i32"))
+                meta = self._read_meta()
+                meta.update(version=meta.get("version", 0) + 1, trained_rows=self._rows)
+                self._write_meta(meta)
+                self._meta = {}
+        return True
+
+    def maintain(self) -> bool:
+        """Train once there are enough rows, and retrain after the set doubles"""
+        with self._lock:
+            self._refresh()
+            rows, trained = self._rows, self._meta.get("trained_rows", 0)
+        if rows >= TRAIN_MIN_ROWS and rows >= 2 * trained:
+            return self.train()
+        return False
+
+    # ---------------- SEARCH ---------------- #
+
+    def _candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        if self._order is None:
+            return np.arange(self._rows)
+        probe = np.argpartition(-(self._centroids @ query), min(nprobe, len(self._centroids)) - 1)[:nprobe]
+        parts = [self._order[self._offsets[l]:self._offsets[l + 1]] for l in probe]
+        parts.append(np.arange(self._sorted_rows, self._rows))
+        return np.sort(np.concatenate(parts))
+
+    def search(self, prediction_id: int, k: int = 10, nprobe: int = DEFAULT_NPROBE) -> Optional[List[Tuple[int, float]]]:
+        """Nearest stored predictions to a stored one, as (prediction_id, cosine similarity)
+
+        Returns None if `prediction_id` has no embedding.
+        """
+        with self._lock:
+            self._refresh()
+            if not self._rows:
+                return None
+            row = self._row_of(prediction_id)
+            if row is None:
+                return None
+            query = np.asarray(self._vectors[row], dtype=np.float32)
+
+            candidates = self._candidates(query, nprobe)
+            scores = np.empty(len(candidates), dtype=np.float32)
+            for start in range(0, len(candidates), _CHUNK_ROWS):
+                rows = candidates[start:start + _CHUNK_ROWS]
+                scores[start:start + len(rows)] = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+            ids = np.asarray(self._ids[candidates])
+
+        keep = ids != prediction_id
+        ids, scores = ids[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return [(int(ids[i]), round(float(scores[i]), 4)) for i in order]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "rows": self._rows,
+                "dim": self._meta.get("dim"),
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "trained_rows": self._meta.get("trained_rows", 0),
+            }
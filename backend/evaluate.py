@@ -0,0 +1,221 @@
+"""
+Offline evaluation harness for AgroGuard AI
+Measure accuracy and speed of a model artifact on a labelled image directory
+
+The directory holds one sub-directory per CLASS_NAMES key:
+    data/Potato___Early_blight/img001.jpg
+    data/Tomato___healthy/...
+
+Usage (from the backend directory):
+    python evaluate.py data/ --output eval_baseline.json
+    python evaluate.py data/ --model models/quantized.keras --output eval_quantized.json
+
+The JSON output (accuracy, per-class precision/recall, confusion matrix,
+throughput and latency percentiles) can be diffed across artifacts.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+import model_loader
+from model_loader import CLASS_NAMES
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp")
+
+
+def find_images(data_dir: str) -> List[Tuple[str, int]]:
+    """(path, class index) for every image under a CLASS_NAMES sub-directory"""
+    class_index = {name: i for i, name in enumerate(CLASS_NAMES)}
+    samples = []
+    for entry in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, entry)
+        if not os.path.isdir(class_dir):
+            continue
+        if entry not in class_index:
+            print(f"[EVAL] Skipping unknown class directory: {entry}", file=sys.stderr)
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, name), class_index[entry]))
+    return samples
+
+
+def _decode_batch(batch: List[Tuple[str, int]]) -> Tuple[np.ndarray, List[int], int]:
+    """Decode images like model_loader.preprocess_image, without TensorFlow
+
+    Runs in a worker process and returns uint8 pixels (4x less to pickle
+    than float32); scaling to 0-1 happens in the parent.
+    """
+    from PIL import Image
+
+    pixels, labels, errors = [], [], 0
+    for path, label in batch:
+        try:
+            with Image.open(path) as img:
+                img = img.convert("RGB")
+                if img.size != (224, 224):
+                    img = img.resize((224, 224), Image.NEAREST)
+                pixels.append(np.asarray(img, dtype=np.uint8))
+            labels.append(label)
+        except Exception:
+            errors += 1
+    array = np.stack(pixels) if pixels else np.empty((0, 224, 224, 3), dtype=np.uint8)
+    return array, labels, errors
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p90": round(float(np.percentile(values, 90)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "mean": round(float(values.mean()), 2),
+    }
+
+
+def classification_metrics(confusion: np.ndarray) -> Dict[str, Any]:
+    """Accuracy and per-class precision/recall/F1 from a confusion matrix (rows = truth)"""
+    true_positive = np.diag(confusion).astype(np.float64)
+    predicted = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    precision = np.divide(true_positive, predicted, out=np.zeros_like(true_positive), where=predicted > 0)
+    recall = np.divide(true_positive, support, out=np.zeros_like(true_positive), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(true_positive), where=(precision + recall) > 0)
+
+    present = support > 0
+    per_class = {
+        name: {
+            "precision": round(float(precision[i]), 4),
+            "recall": round(float(recall[i]), 4),
+            "f1": round(float(f1[i]), 4),
+            "support": int(support[i]),
+        }
+        for i, name in enumerate(CLASS_NAMES)
+    }
+    return {
+        "accuracy": round(float(true_positive.sum() / max(confusion.sum(), 1)), 4),
+        "macro_precision": round(float(precision[present].mean()), 4) if present.any() else 0.0,
+        "macro_recall": round(float(recall[present].mean()), 4) if present.any() else 0.0,
+        "macro_f1": round(float(f1[present].mean()), 4) if present.any() else 0.0,
+        "per_class": per_class,
+    }
+
+
+def evaluate(data_dir: str, batch_size: int = 32, decode_workers: int = 0,
+             latency_samples: int = 50, limit: int = 0) -> Dict[str, Any]:
+    samples = find_images(data_dir)
+    if limit:
+        samples = samples[:limit]
+    if not samples:
+        raise ValueError(f"No labelled images found under {data_dir}")
+
+    decode_workers = decode_workers or len(os.sched_getaffinity(0))
+    batches = [samples[i:i + batch_size] for i in range(0, len(samples), batch_size)]
+    print(f"[EVAL] {len(samples)} images, {len(batches)} batches, {decode_workers} decode workers",
+          file=sys.stderr)
+
+    # Start decoders before TensorFlow loads; spawn keeps them free of its threads
+    pool = multiprocessing.get_context("spawn").Pool(decode_workers)
+    try:
+        load_start = time.perf_counter()
+        model = model_loader.load_keras_model()
+        model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+        load_seconds = time.perf_counter() - load_start
+
+        n_classes = len(CLASS_NAMES)
+        confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+        batch_latencies, errors, scored = [], 0, 0
+
+        started = time.perf_counter()
+        for pixels, labels, batch_errors in pool.imap(_decode_batch, batches):
+            errors += batch_errors
+            if not labels:
+                continue
+            inputs = pixels.astype(np.float32) / 255.0
+            predict_start = time.perf_counter()
+            probs = model.predict(inputs, batch_size=len(inputs), verbose=0)
+            batch_latencies.append(time.perf_counter() - predict_start)
+            np.add.at(confusion, (np.asarray(labels), probs.argmax(axis=1)), 1)
+            scored += len(labels)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.close()
+        pool.join()
+
+    # Request-like latency: one image per forward pass
+    single_latencies = []
+    if latency_samples:
+        image = np.random.rand(1, 224, 224, 3).astype(np.float32)
+        for _ in range(latency_samples):
+            predict_start = time.perf_counter()
+            model.predict(image, verbose=0)
+            single_latencies.append(time.perf_counter() - predict_start)
+
+    return {
+        "model": os.path.abspath(model_loader.MODEL_PATH),
+        "model_size_bytes": os.path.getsize(model_loader.MODEL_PATH),
+        "data_dir": os.path.abspath(data_dir),
+        "images": scored,
+        "decode_errors": errors,
+        "batch_size": batch_size,
+        "decode_workers": decode_workers,
+        **classification_metrics(confusion),
+        "confusion_matrix": {
+            "labels": list(CLASS_NAMES),
+            "matrix": confusion.tolist(),
+        },
+        "throughput": {
+            "end_to_end_images_per_sec": round(scored / elapsed, 2),
+            "model_images_per_sec": round(scored / sum(batch_latencies), 2),
+        },
+        "latency_ms": {
+            "batch": _percentiles(batch_latencies),
+            "single_image": _percentiles(single_latencies) if single_latencies else None,
+        },
+        "model_load_seconds": round(load_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a model artifact on a labelled image directory")
+    parser.add_argument("data_dir", help="Directory with one sub-directory per CLASS_NAMES key")
+    parser.add_argument("--model", default=None, help="Model artifact (default: MODEL_PATH)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--decode-workers", type=int, default=0, help="Default: one per CPU")
+    parser.add_argument("--latency-samples", type=int, default=50,
+                        help="Single-image forward passes timed after the run")
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate only the first N images")
+    parser.add_argument("--output", default=None, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if args.model:
+        model_loader.MODEL_PATH = args.model
+    if not os.path.exists(model_loader.MODEL_PATH):
+        parser.error(f"Model file not found at {model_loader.MODEL_PATH}")
+
+    result = evaluate(args.data_dir, args.batch_size, args.decode_workers, args.latency_samples, args.limit)
+
+    print(f"[EVAL] accuracy {result['accuracy']:.4f}  macro F1 {result['macro_f1']:.4f}  "
+          f"{result['throughput']['end_to_end_images_per_sec']:.1f} img/s  "
+          f"single-image p50 {(result['latency_ms']['single_image'] or {}).get('p50', 0):.1f} ms",
+          file=sys.stderr)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"[EVAL] Wrote {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""
+Inference job queue for AgroGuard AI
+Pluggable queue between API nodes and standalone inference workers
+
+Backends, selected by URL (INFERENCE_QUEUE):
+    sqlite:///agroguard_queue.db   single machine, no extra services
+    redis://host:6379/0            many machines (needs the `redis` package)
+
+Jobs carry the image bytes, so workers need no shared filesystem. A claimed
+job holds a lease that its worker renews while it runs; if the worker dies,
+the lease expires and the job is requeued until `max_attempts` is reached.
+Results and failures are only accepted from the worker and attempt that
+still hold the job. Workers heartbeat so the API can report how many are
+alive.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Optional, Dict, Any, List
+
+DEFAULT_QUEUE_URL = "sqlite:///agroguard_queue.db"
+DEFAULT_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+DEFAULT_LEASE = float(os.getenv("INFERENCE_LEASE", "60"))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("INFERENCE_MAX_ATTEMPTS", "3"))
+
+# A worker is considered dead after this many seconds without a heartbeat
+WORKER_STALE_AFTER = 30
+
+
+def _failure(error: str) -> Dict[str, Any]:
+    """predict_disease-shaped failure result"""
+    return {
+        "success": False,
+        "error": error,
+        "predicted_class": None,
+        "confidence": 0.0,
+        "treatment": "",
+        "medicine": ""
+    }
+
+
+class JobQueue:
+    """Interface shared by the queue backends"""
+
+    def submit(self, payload: bytes, image_name: str, options: Optional[Dict[str, Any]] = None,
+               max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+        """Enqueue an image with predict_disease options and return the job id"""
+        raise NotImplementedError
+
+    def wait_result(self, job_id: str, timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+        """Block until the job finishes; returns a failure result on timeout"""
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease: float = DEFAULT_LEASE, block: float = 1.0) -> Optional[Dict[str, Any]]:
+        """Take the next job (id, payload, image_name, options, attempts) or None"""
+        raise NotImplementedError
+
+    def renew_lease(self, job_id: str, worker_id: str, attempt: int, lease: float = DEFAULT_LEASE) -> bool:
+        """Extend a running job's lease; False if the worker no longer holds it"""
+        raise NotImplementedError
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker_id: str, attempt: int) -> bool:
+        """Store a finished job's result; False (and nothing stored) if the lease was lost"""
+        raise NotImplementedError
+
+    def fail(self, job_id: str, error: str, worker_id: str, attempt: int):
+        """Requeue a job after a worker error, or fail it when out of attempts"""
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id: str, info: Dict[str, Any]):
+        """Record that a worker is alive, with its counters"""
+        raise NotImplementedError
+
+    def deregister(self, worker_id: str):
+        """Remove a worker that is shutting down cleanly"""
+        raise NotImplementedError
+
+    def workers(self) -> List[Dict[str, Any]]:
+        """Known workers with an `alive` flag"""
+        raise NotImplementedError
+
+    def predict(self, image_path: str, options: Optional[Dict[str, Any]] = None,
+                timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+        """Submit an image file and wait for its prediction"""
+        with open(image_path, "rb") as f:
+            payload = f.read()
+        job_id = self.submit(payload, os.path.basename(image_path), options)
+        return self.wait_result(job_id, timeout)
+
+    def predict_batch(self, image_paths: List[str], timeout: float = DEFAULT_TIMEOUT) -> List[Dict[str, Any]]:
+        """Submit several images at once so idle workers pick them up in parallel"""
+        job_ids = []
+        for image_path in image_paths:
+            with open(image_path, "rb") as f:
+                job_ids.append(self.submit(f.read(), os.path.basename(image_path)))
+
+        deadline = time.monotonic() + timeout
+        return [self.wait_result(job_id, max(deadline - time.monotonic(), 0.0)) for job_id in job_ids]
+
+
+# ---------------- SQLITE BACKEND ---------------- #
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue in a WAL-mode SQLite file (one machine)"""
+
+    def __init__(self, path: str, poll_interval: float = 0.02):
+        self.path = path
+        self.poll_interval = poll_interval
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                payload BLOB,
+                image_name TEXT NOT NULL,
+                options TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker_id TEXT,
+                lease_expires REAL,
+                result TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        if "options" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN options TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                last_heartbeat REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, payload, image_name, options=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """INSERT INTO jobs (id, status, payload, image_name, options, max_attempts, created_at)
+                   VALUES (?, 'queued', ?, ?, ?, ?, ?)""",
+                (job_id, payload, image_name, json.dumps(options or {}), max_attempts, time.time())
+            )
+        conn.close()
+        return job_id
+
+    def wait_result(self, job_id, timeout=DEFAULT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        conn = self._connect()
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT status, result FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+                if row is None:
+                    return _failure("Inference job disappeared")
+                if row["status"] in ("done", "failed"):
+                    with conn:
+                        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    return json.loads(row["result"])
+                if time.monotonic() >= deadline:
+                    # Withdraw the job so no worker spends time on it
+                    with conn:
+                        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    return _failure(f"Inference timed out after {timeout:g}s")
+                time.sleep(self.poll_interval)
+        finally:
+            conn.close()
+
+    def _expire_leases(self, conn, now: float):
+        conn.execute(
+            """UPDATE jobs SET status = 'queued', worker_id = NULL, lease_expires = NULL
+               WHERE status = 'running' AND lease_expires < ? AND attempts < max_attempts""",
+            (now,)
+        )
+        conn.execute(
+            """UPDATE jobs SET status = 'failed', payload = NULL, result = ?
+               WHERE status = 'running' AND lease_expires < ?""",
+            (json.dumps(_failure("Inference worker lost the job")), now)
+        )
+
+    def claim(self, worker_id, lease=DEFAULT_LEASE, block=1.0):
+        deadline = time.monotonic() + block
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            while True:
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._expire_leases(conn, now)
+                    row = conn.execute(
+                        """SELECT id, payload, image_name, options, attempts FROM jobs
+                           WHERE status = 'queued' ORDER BY created_at LIMIT 1"""
+                    ).fetchone()
+                    if row:
+                        conn.execute(
+                            """UPDATE jobs SET status = 'running', worker_id = ?,
+                                   attempts = attempts + 1, lease_expires = ?
+                               WHERE id = ?""",
+                            (worker_id, now + lease, row["id"])
+                        )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+
+                if row:
+                    return {
+                        "id": row["id"],
+                        "payload": row["payload"],
+                        "image_name": row["image_name"],
+                        "options": json.loads(row["options"] or "{}"),
+                        "attempts": row["attempts"] + 1,
+                    }
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.poll_interval)
+        finally:
+            conn.close()
+
+    # Matches a job only while this claim of it is still running
+    _OWNED = "id = ? AND status = 'running' AND worker_id = ? AND attempts = ?"
+
+    def renew_lease(self, job_id, worker_id, attempt, lease=DEFAULT_LEASE):
+        conn = self._connect()
+        with conn:
+            renewed = conn.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE {self._OWNED}",
+                (time.time() + lease, job_id, worker_id, attempt)
+            ).rowcount
+        conn.close()
+        return renewed > 0
+
+    def complete(self, job_id, result, worker_id, attempt):
+        conn = self._connect()
+        with conn:
+            stored = conn.execute(
+                f"UPDATE jobs SET status = 'done', payload = NULL, result = ? WHERE {self._OWNED}",
+                (json.dumps(result), job_id, worker_id, attempt)
+            ).rowcount
+        conn.close()
+        return stored > 0
+
+    def fail(self, job_id, error, worker_id, attempt):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"""UPDATE jobs SET status = 'queued', worker_id = NULL, lease_expires = NULL
+                    WHERE {self._OWNED} AND attempts < max_attempts""",
+                (job_id, worker_id, attempt)
+            )
+            conn.execute(
+                f"UPDATE jobs SET status = 'failed', payload = NULL, result = ? WHERE {self._OWNED}",
+                (json.dumps(_failure(error)), job_id, worker_id, attempt)
+            )
+        conn.close()
+
+    def heartbeat(self, worker_id, info):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """INSERT INTO workers (worker_id, info, last_heartbeat) VALUES (?, ?, ?)
+                   ON CONFLICT (worker_id) DO UPDATE SET
+                       info = excluded.info, last_heartbeat = excluded.last_heartbeat""",
+                (worker_id, json.dumps(info), time.time())
+            )
+        conn.close()
+
+    def deregister(self, worker_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+        conn.close()
+
+    def workers(self):
+        conn = self._connect()
+        rows = conn.execute("SELECT * FROM workers ORDER BY worker_id").fetchall()
+        conn.close()
+        now = time.time()
+        return [
+            {
+                "worker_id": row["worker_id"],
+                "last_heartbeat": row["last_heartbeat"],
+                "alive": now - row["last_heartbeat"] < WORKER_STALE_AFTER,
+                **json.loads(row["info"]),
+            }
+            for row in rows
+        ]
+
+
+# ---------------- REDIS BACKEND ---------------- #
+
+class RedisJobQueue(JobQueue):
+    """Job queue on Redis (or any Redis-protocol server) for many machines"""
+
+    def __init__(self, url: str, prefix: str = "agroguard:inference"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis queue backend requires the `redis` package")
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def submit(self, payload, image_name, options=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex
+        pipe = self.client.pipeline()
+        pipe.hset(self._key("job", job_id), mapping={
+            "payload": payload,
+            "image_name": image_name,
+            "options": json.dumps(options or {}),
+            "attempts": 0,
+            "max_attempts": max_attempts,
+        })
+        pipe.lpush(self._key("queued"), job_id)
+        pipe.execute()
+        return job_id
+
+    def wait_result(self, job_id, timeout=DEFAULT_TIMEOUT):
+        item = self.client.blpop(self._key("result", job_id), timeout=max(1, int(timeout)))
+        if item is None:
+            # Withdraw the job; a worker that already claimed it finds no payload
+            self.client.lrem(self._key("queued"), 0, job_id)
+            self.client.delete(self._key("job", job_id))
+            return _failure(f"Inference timed out after {timeout:g}s")
+        self.client.delete(self._key("job", job_id))
+        return json.loads(item[1])
+
+    def _publish(self, job_id: str, result: Dict[str, Any]):
+        pipe = self.client.pipeline()
+        pipe.rpush(self._key("result", job_id), json.dumps(result))
+        pipe.expire(self._key("result", job_id), int(DEFAULT_TIMEOUT) * 2)
+        pipe.execute()
+
+    def _requeue_or_fail(self, job_id: str, error: str):
+        """Requeue or fail a job the caller has just removed from the running set"""
+        job = self.client.hmget(self._key("job", job_id), "attempts", "max_attempts")
+        if job[0] is None:
+            return
+        if int(job[0]) < int(job[1]):
+            self.client.rpush(self._key("queued"), job_id)
+        else:
+            self._publish(job_id, _failure(error))
+
+    def _holds(self, job_id: str, worker_id: str, attempt: int) -> bool:
+        owner, attempts = self.client.hmget(self._key("job", job_id), "worker_id", "attempts")
+        return owner is not None and owner.decode() == worker_id and int(attempts) == attempt
+
+    def claim(self, worker_id, lease=DEFAULT_LEASE, block=1.0):
+        # Requeue jobs whose worker let the lease run out; ZREM decides
+        # which caller owns each expired job.
+        for job_id in self.client.zrangebyscore(self._key("running"), "-inf", time.time()):
+            if self.client.zrem(self._key("running"), job_id):
+                self._requeue_or_fail(job_id.decode(), "Inference worker lost the job")
+
+        item = self.client.brpop(self._key("queued"), timeout=max(1, int(block)))
+        if item is None:
+            return None
+        job_id = item[1].decode()
+        pipe = self.client.pipeline()
+        pipe.zadd(self._key("running"), {job_id: time.time() + lease})
+        pipe.hincrby(self._key("job", job_id), "attempts", 1)
+        pipe.hset(self._key("job", job_id), "worker_id", worker_id)
+        attempts = pipe.execute()[1]
+        payload, image_name, options = self.client.hmget(
+            self._key("job", job_id), "payload", "image_name", "options"
+        )
+        if payload is None:
+            # Withdrawn after a timeout
+            self.client.zrem(self._key("running"), job_id)
+            self.client.delete(self._key("job", job_id))
+            return None
+        return {
+            "id": job_id,
+            "payload": payload,
+            "image_name": image_name.decode(),
+            "options": json.loads(options or b"{}"),
+            "attempts": attempts,
+        }
+
+    def renew_lease(self, job_id, worker_id, attempt, lease=DEFAULT_LEASE):
+        if not self._holds(job_id, worker_id, attempt):
+            return False
+        # XX: never re-add a job whose expired lease another worker has reaped
+        return bool(self.client.zadd(self._key("running"), {job_id: time.time() + lease}, xx=True, ch=True))
+
+    def complete(self, job_id, result, worker_id, attempt):
+        # As with expired leases, ZREM decides who owns the job
+        if not self._holds(job_id, worker_id, attempt) or not self.client.zrem(self._key("running"), job_id):
+            return False
+        self._publish(job_id, result)
+        return True
+
+    def fail(self, job_id, error, worker_id, attempt):
+        if self._holds(job_id, worker_id, attempt) and self.client.zrem(self._key("running"), job_id):
+            self._requeue_or_fail(job_id, error)
+
+    def heartbeat(self, worker_id, info):
+        self.client.hset(self._key("workers"), worker_id, json.dumps({
+            **info, "last_heartbeat": time.time()
+        }))
+
+    def deregister(self, worker_id):
+        self.client.hdel(self._key("workers"), worker_id)
+
+    def workers(self):
+        now = time.time()
+        result = []
+        for worker_id, raw in sorted(self.client.hgetall(self._key("workers")).items()):
+            info = json.loads(raw)
+            info["worker_id"] = worker_id.decode()
+            info["alive"] = now - info["last_heartbeat"] < WORKER_STALE_AFTER
+            result.append(info)
+        return result
+
+
+# ---------------- FACTORY ---------------- #
+
+_queues: Dict[str, JobQueue] = {}
+
+
+def get_job_queue(url: str = DEFAULT_QUEUE_URL) -> JobQueue:
+    """Get (and cache) the queue backend for a URL"""
+    if url not in _queues:
+        if url.startswith("sqlite:///"):
+            _queues[url] = SQLiteJobQueue(url[len("sqlite:///"):])
+        elif url.startswith(("redis://", "rediss://", "unix://")):
+            _queues[url] = RedisJobQueue(url)
+        else:
+            raise ValueError(f"Unsupported inference queue URL: {url}")
+    return _queues[url]
+
+
+def worker_identity() -> Dict[str, Any]:
+    """Static description of this worker process"""
+    return {"hostname": socket.gethostname(), "pid": os.getpid()}
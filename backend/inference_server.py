@@ -0,0 +1,182 @@
+"""
+Inference server for AgroGuard AI
+Hold one warmed-up model in a single process and serve API workers over a Unix socket
+
+Run standalone:
+    python inference_server.py --socket /tmp/agroguard-inference.sock
+or let serve.py start it.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+DEFAULT_SOCKET = "/tmp/agroguard-inference.sock"
+REQUEST_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+
+_HEADER = struct.Struct("!I")
+
+
+# ---------------- FRAMING ---------------- #
+
+def _send_message(sock: socket.socket, message: Dict[str, Any]):
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Inference server closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _recv_message(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+# ---------------- CLIENT ---------------- #
+
+def _call(socket_path: str, message: Dict[str, Any], timeout: float = REQUEST_TIMEOUT) -> Dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        _send_message(sock, message)
+        return _recv_message(sock)
+
+
+def _unavailable(error: str) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error": f"Inference server unavailable: {error}",
+        "predicted_class": None,
+        "confidence": 0.0,
+        "treatment": "",
+        "medicine": ""
+    }
+
+
+def request_inference(socket_path: str, image_path: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run predict_disease in the inference server; same result shape as in-process"""
+    try:
+        return _call(socket_path, {
+            "op": "predict",
+            "image_path": os.path.abspath(image_path),
+            "options": options or {},
+        })
+    except Exception as e:
+        return _unavailable(str(e))
+
+
+def request_inference_batch(socket_path: str, image_paths: List[str]) -> List[Dict[str, Any]]:
+    """Run predict_disease_batch in the inference server"""
+    try:
+        return _call(socket_path, {
+            "op": "predict_batch",
+            "image_paths": [os.path.abspath(path) for path in image_paths],
+        })["results"]
+    except Exception as e:
+        return [_unavailable(str(e)) for _ in image_paths]
+
+
+def check_health(socket_path: str, timeout: float = 1.0) -> Dict[str, Any]:
+    """Ask the inference server for its status; raises if it is not reachable"""
+    return _call(socket_path, {"op": "health"}, timeout=timeout)
+
+
+# ---------------- SERVER ---------------- #
+
+class _InferenceHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        from model_loader import predict_disease, predict_disease_batch, get_prefilter_stats
+
+        try:
+            message = _recv_message(self.request)
+        except Exception:
+            return
+
+        op = message.get("op")
+        if op == "predict":
+            response = predict_disease(message["image_path"], **message.get("options", {}))
+        elif op == "predict_batch":
+            response = {"results": predict_disease_batch(message["image_paths"])}
+        elif op == "health":
+            response = {
+                "status": "ok",
+                "pid": os.getpid(),
+                "uptime": time.time() - self.server.started_at,
+                "prefilter": get_prefilter_stats(),
+            }
+        else:
+            response = {"success": False, "error": f"Unknown op: {op}"}
+
+        try:
+            _send_message(self.request, response)
+        except OSError:
+            pass
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _InferenceHandler)
+        self.started_at = time.time()
+
+
+def _watch_parent(parent_pid: int, server: InferenceServer):
+    """Shut the server down if the launcher dies without stopping it"""
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgroGuard AI inference server")
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET_PATH", DEFAULT_SOCKET))
+    parser.add_argument("--parent-pid", type=int, default=None,
+                        help="Exit when this process (e.g. serve.py) goes away")
+    args = parser.parse_args()
+
+    # Never forward to ourselves
+    os.environ.pop("INFERENCE_SOCKET", None)
+    from model_loader import warm_up_model, set_serving_mode
+
+    # The only model copy on the node: use the single-process tuning
+    set_serving_mode("shared")
+
+    start = time.perf_counter()
+    warm_up_model()
+    print(f"[INFERENCE] Model warmed up in {time.perf_counter() - start:.2f}s (pid {os.getpid()})")
+
+    server = InferenceServer(args.socket)
+    print(f"[INFERENCE] Listening on {args.socket}")
+
+    if args.parent_pid:
+        threading.Thread(
+            target=_watch_parent, args=(args.parent_pid, server), daemon=True
+        ).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
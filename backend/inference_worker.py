@@ -0,0 +1,130 @@
+"""
+Inference worker for AgroGuard AI
+Standalone process that pulls prediction jobs from the inference queue
+
+Run one or more per machine, pointing at the same queue as the API:
+    python inference_worker.py --queue redis://queue-host:6379/0
+"""
+
+import argparse
+import os
+import signal
+import tempfile
+import threading
+import time
+import uuid
+
+from inference_queue import get_job_queue, worker_identity, DEFAULT_QUEUE_URL, DEFAULT_LEASE
+
+
+class InferenceWorker:
+    """Claim jobs, run predict_disease on them and publish the results
+
+    The heartbeat also renews the lease of the job being processed, so the
+    lease only needs to outlast a few missed heartbeats, not the job.
+    """
+
+    def __init__(self, queue_url: str, lease: float = DEFAULT_LEASE, heartbeat_interval: float = 5.0):
+        self.queue = get_job_queue(queue_url)
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f"{worker_identity()['hostname']}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.started_at = time.time()
+        self._current = None
+        self._stopping = threading.Event()
+
+    def stop(self, *_):
+        """Finish the current job, then exit"""
+        self._stopping.set()
+
+    def _info(self):
+        # Imported here: model_loader reads INFERENCE_QUEUE at import, which
+        # main() clears first
+        from model_loader import get_prefilter_stats
+
+        return {
+            **worker_identity(),
+            "started_at": self.started_at,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+            "prefilter": get_prefilter_stats(),
+        }
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            try:
+                self.queue.heartbeat(self.worker_id, self._info())
+                job = self._current
+                if job is not None and not self.queue.renew_lease(
+                    job["id"], self.worker_id, job["attempts"], self.lease
+                ):
+                    print(f"[WORKER] Lost the lease on job {job['id']}")
+            except Exception as e:
+                print(f"[WORKER] Heartbeat failed: {str(e)}")
+
+    def _process(self, job):
+        from model_loader import predict_disease
+
+        suffix = os.path.splitext(job["image_name"])[1] or ".jpg"
+        with tempfile.NamedTemporaryFile(suffix=suffix) as image_file:
+            image_file.write(job["payload"])
+            image_file.flush()
+            return predict_disease(image_file.name, **job.get("options", {}))
+
+    def run(self):
+        from model_loader import warm_up_model
+
+        start = time.perf_counter()
+        warm_up_model()
+        print(f"[WORKER] {self.worker_id} ready in {time.perf_counter() - start:.2f}s")
+
+        self.queue.heartbeat(self.worker_id, self._info())
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+        try:
+            while not self._stopping.is_set():
+                job = self.queue.claim(self.worker_id, lease=self.lease)
+                if job is None:
+                    continue
+                self._current = job
+                try:
+                    result = self._process(job)
+                    if self.queue.complete(job["id"], result, self.worker_id, job["attempts"]):
+                        self.jobs_done += 1
+                    else:
+                        print(f"[WORKER] Job {job['id']} result discarded: lease lost")
+                except Exception as e:
+                    print(f"[WORKER] Job {job['id']} attempt {job['attempts']} failed: {str(e)}")
+                    self.queue.fail(job["id"], str(e), self.worker_id, job["attempts"])
+                    self.jobs_failed += 1
+                finally:
+                    self._current = None
+        finally:
+            self.queue.deregister(self.worker_id)
+            print(f"[WORKER] {self.worker_id} stopped after {self.jobs_done} job(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgroGuard AI inference worker")
+    parser.add_argument("--queue", default=os.getenv("INFERENCE_QUEUE", DEFAULT_QUEUE_URL))
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                        help="Seconds without a lease renewal before a job is handed to another worker")
+    parser.add_argument("--heartbeat", type=float, default=5.0, help="Heartbeat interval in seconds")
+    args = parser.parse_args()
+    if args.heartbeat >= args.lease:
+        parser.error("--heartbeat must be shorter than --lease, or leases expire between renewals")
+
+    # Workers run the model themselves
+    os.environ.pop("INFERENCE_QUEUE", None)
+    os.environ.pop("INFERENCE_SOCKET", None)
+
+    worker = InferenceWorker(args.queue, lease=args.lease, heartbeat_interval=args.heartbeat)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,38 +5,63 @@ Main application file with API endpoints
 
 import os
 import shutil
-from datetime import datetime, timedelta
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, status, Header
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+import asyncio
+import tempfile
+import uuid
+from datetime import datetime, timedelta, date
+from fastapi import (
+    FastAPI, File, UploadFile, HTTPException, Depends, status, Header, Query,
+    WebSocket, WebSocketDisconnect, Request, Response
+)
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List, Dict, Any
 
 # Import local modules
 from database import (
-    init_db, seed_demo_user, create_user, get_user_by_email, get_user_by_id,
-    save_prediction, get_user_predictions, get_prediction_by_id,
-    save_report, get_user_reports, get_report_by_id
+    init_db, seed_demo_user, iter_user_predictions, iter_user_prediction_batches
 )
+import async_database as db
 from auth import (
     hash_password, verify_password, create_access_token, verify_token
 )
-from model_loader import predict_disease, get_class_names
-from utils.report_generator import generate_pdf_report, get_reports_directory
-
-# Log TensorFlow / Keras versions at startup to help debug environment issues
-try:
-    import tensorflow as _tf
-    tf_version = getattr(_tf, "__version__", "unknown")
-except Exception:
-    tf_version = "not-installed"
-
-try:
-    import keras as _keras  # type: ignore
-    keras_version = getattr(_keras, "__version__", "unknown")
-except Exception:
-    keras_version = "not-installed"
+from write_behind import PredictionWriteBehind
+from streaming import FrameStream
+from embedding_index import EmbeddingIndex
+from admission import TokenBucketLimiter, FairScheduler, AdmissionRejected
+from profiling import SamplingProfiler, SlowRequestLog, RequestTimingMiddleware, stage
+from maintenance import run_maintenance, local_copy
+from analytics import init_analytics_db, rollup_predictions, get_disease_trends, TREND_BUCKETS
+from model_loader import (
+    predict_disease, get_class_names, warm_up_model, get_prefilter_stats, summarize_prefilter_stats,
+    INFERENCE_SOCKET, INFERENCE_QUEUE
+)
+from utils.exporter import stream_export, EXPORT_MEDIA_TYPES
+from utils.http_cache import CompressionMiddleware, CachedStaticFiles, etag_matches
+from utils.report_generator import (
+    generate_pdf_report, generate_field_report, get_reports_directory, compute_render_key,
+    cleanup_orphaned_reports, REPORT_TEMPLATE_VERSION
+)
+
+# Log TensorFlow / Keras versions at startup to help debug environment issues.
+# Workers that forward inference to a shared server or queue skip this so
+# they never import TensorFlow.
+if os.getenv("INFERENCE_SOCKET") or os.getenv("INFERENCE_QUEUE"):
+    tf_version = keras_version = "remote"
+else:
+    try:
+        import tensorflow as _tf
+        tf_version = getattr(_tf, "__version__", "unknown")
+    except Exception:
+        tf_version = "not-installed"
+
+    try:
+        import keras as _keras  # type: ignore
+        keras_version = getattr(_keras, "__version__", "unknown")
+    except Exception:
+        keras_version = "not-installed"
 
 print(f"[STARTUP] TensorFlow version: {tf_version}; Keras (standalone) version: {keras_version}")
 
@@ -56,16 +81,172 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (brotli when installed, else gzip)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+)
+
+# Per-stage request timings and on-demand profiling (/admin/profile)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+profiler = SamplingProfiler()
+slow_requests = SlowRequestLog(
+    size=int(os.getenv("SLOW_REQUEST_LOG_SIZE", "50")),
+    threshold_ms=float(os.getenv("SLOW_REQUEST_MS", "500"))
+)
+app.add_middleware(RequestTimingMiddleware, slow_log=slow_requests, profiler=profiler)
+
 # Create static directory for uploads
 UPLOAD_DIR = "static/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files; uploads and reports get unique names, so they can be
+# cached by clients forever
+app.mount(
+    "/static",
+    CachedStaticFiles(directory="static", immutable_dirs=("uploads", "reports")),
+    name="static"
+)
 
 # Initialize database
 init_db()
 seed_demo_user()
+init_analytics_db()
+
+# Write-behind queue for prediction inserts
+prediction_writer = PredictionWriteBehind(
+    flush_rows=int(os.getenv("PREDICTION_FLUSH_ROWS", "64")),
+    flush_interval_ms=int(os.getenv("PREDICTION_FLUSH_MS", "50"))
+)
+
+# Admission control: per-user rate limit and fair sharing of inference slots.
+# Limits are node-wide; state is per process, so with API_WORKERS workers
+# (set by serve.py) each enforces its share
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+rate_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", "60")) / 60.0 / API_WORKERS,
+    burst=max(1.0, float(os.getenv("RATE_LIMIT_BURST", "20")) / API_WORKERS)
+)
+inference_scheduler = FairScheduler(
+    concurrency=max(1, int(os.getenv("INFERENCE_CONCURRENCY", "2")) // API_WORKERS),
+    lane_weights={"interactive": int(os.getenv("INTERACTIVE_LANE_WEIGHT", "4")), "bulk": 1},
+    max_queue_per_user=max(1, int(os.getenv("SCHEDULER_MAX_QUEUE_PER_USER", "8")) // API_WORKERS),
+    max_wait=float(os.getenv("SCHEDULER_MAX_WAIT", "30"))
+)
+
+# Live frame streaming (/ws/stream)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "8"))
+STREAM_MAX_FRAME_AGE_MS = int(os.getenv("STREAM_MAX_FRAME_AGE_MS", "1000"))
+STREAM_DUPLICATE_DISTANCE = int(os.getenv("STREAM_DUPLICATE_DISTANCE", "4"))
+STREAM_MAX_FRAME_BYTES = int(os.getenv("STREAM_MAX_FRAME_BYTES", str(5 * 1024 * 1024)))
+
+# Similar-case retrieval: store a feature embedding for every prediction
+ENABLE_EMBEDDINGS = os.getenv("ENABLE_EMBEDDINGS") == "1"
+EMBEDDING_INDEX_INTERVAL = int(os.getenv("EMBEDDING_INDEX_INTERVAL", "600"))
+embedding_index = EmbeddingIndex() if ENABLE_EMBEDDINGS else None
+
+# Orphaned report cleanup interval (seconds)
+REPORT_CLEANUP_INTERVAL = int(os.getenv("REPORT_CLEANUP_INTERVAL", "3600"))
+
+
+async def _report_cleanup_loop():
+    """Periodically delete report files no longer referenced by the database"""
+    while True:
+        try:
+            removed = await run_in_threadpool(
+                cleanup_orphaned_reports, await db.get_all_report_paths()
+            )
+            if removed:
+                print(f"[CLEANUP] Removed {removed} orphaned report file(s)")
+        except Exception as e:
+            print(f"[CLEANUP] ERROR: {str(e)}")
+        await asyncio.sleep(REPORT_CLEANUP_INTERVAL)
+
+
+# Analytics rollup interval (seconds)
+ANALYTICS_ROLLUP_INTERVAL = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "300"))
+
+
+async def _analytics_rollup_loop():
+    """Periodically fold new predictions into the analytics store"""
+    while True:
+        try:
+            rolled_up = await run_in_threadpool(rollup_predictions)
+            if rolled_up:
+                print(f"[ANALYTICS] Rolled up {rolled_up} prediction(s)")
+        except Exception as e:
+            print(f"[ANALYTICS] ERROR: {str(e)}")
+        await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL)
+
+
+# How often to check whether the maintenance window has opened (seconds)
+MAINTENANCE_CHECK_INTERVAL = int(os.getenv("MAINTENANCE_CHECK_INTERVAL", "600"))
+
+
+async def _maintenance_loop():
+    """Archive aged files and optimise the database once per maintenance window"""
+    while True:
+        await asyncio.sleep(MAINTENANCE_CHECK_INTERVAL)
+        try:
+            await run_in_threadpool(run_maintenance, UPLOAD_DIR, get_reports_directory(), "scheduled")
+        except Exception as e:
+            print(f"[MAINTENANCE] ERROR: {str(e)}")
+
+
+async def _embedding_index_loop():
+    """Periodically (re)train the similar-case index as embeddings accumulate"""
+    while True:
+        await asyncio.sleep(EMBEDDING_INDEX_INTERVAL)
+        try:
+            if await run_in_threadpool(embedding_index.maintain):
+                print(f"[EMBEDDINGS] Index trained: {embedding_index.stats()}")
+        except Exception as e:
+            print(f"[EMBEDDINGS] ERROR: {str(e)}")
+
+
+@app.on_event("startup")
+async def preload_model():
+    """Load and warm the model before serving when PRELOAD_MODEL is set"""
+    if os.getenv("PRELOAD_MODEL") == "1" and not (INFERENCE_SOCKET or INFERENCE_QUEUE):
+        await run_in_threadpool(warm_up_model)
+
+
+@app.on_event("startup")
+async def start_prediction_writer():
+    """Start the prediction write-behind flusher"""
+    prediction_writer.start()
+
+
+@app.on_event("shutdown")
+async def stop_prediction_writer():
+    """Commit queued predictions before the process exits"""
+    await run_in_threadpool(prediction_writer.close)
+
+
+@app.on_event("startup")
+async def start_report_cleanup():
+    """Start the orphaned report cleanup job"""
+    asyncio.create_task(_report_cleanup_loop())
+
+
+@app.on_event("startup")
+async def start_analytics_rollup():
+    """Start the analytics rollup job"""
+    asyncio.create_task(_analytics_rollup_loop())
+
+
+@app.on_event("startup")
+async def start_maintenance():
+    """Start the storage maintenance job"""
+    asyncio.create_task(_maintenance_loop())
+
+
+@app.on_event("startup")
+async def start_embedding_index():
+    """Start the similar-case index maintenance job"""
+    if embedding_index is not None:
+        asyncio.create_task(_embedding_index_loop())
 
 # Pydantic models
 class RegisterRequest(BaseModel):
@@ -93,6 +274,15 @@ class PredictionResponse(BaseModel):
     treatment: str
     medicine: str
     prediction_id: int
+    tiles: Optional[Dict[str, Any]] = None
+    quality: Optional[Dict[str, Any]] = None
+    tta: Optional[Dict[str, Any]] = None
+
+
+class FieldReportRequest(BaseModel):
+    prediction_ids: Optional[List[int]] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
 
 
 class ReportResponse(BaseModel):
@@ -103,7 +293,20 @@ class ReportResponse(BaseModel):
 
 
 # Helper functions
-def get_current_user(authorization: Optional[str] = Header(None)):
+def _iter_file_chunks(file_obj, chunk_size: int = 64 * 1024):
+    """Yield a file's contents in chunks and close it afterwards"""
+    try:
+        file_obj.seek(0)
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)):
     """Get current user from JWT token"""
     if not authorization:
         raise HTTPException(
@@ -138,7 +341,7 @@ def get_current_user(authorization: Optional[str] = Header(None)):
             detail="Invalid token"
         )
     
-    user = get_user_by_id(user_id)
+    user = await db.get_user_by_id(user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -148,6 +351,80 @@ def get_current_user(authorization: Optional[str] = Header(None)):
     return user
 
 
+async def get_admin_user(authorization: Optional[str] = Header(None)):
+    """Get current user and require their email to be listed in ADMIN_EMAILS"""
+    user = await get_current_user(authorization)
+    if user["email"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return user
+
+
+async def _not_modified(request: Request, response: Response, user_id: int) -> Optional[Response]:
+    """Tag a per-user response with an ETag; returns a 304 if the client already has it
+
+    The tag is the user's data version, bumped on every change to their
+    predictions or reports, so checking it is one primary-key lookup.
+    """
+    etag = f'W/"{user_id}.{await db.get_user_data_version(user_id)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def _render_pdf(predicted_class: str, **report_fields) -> tuple:
+    """Render a report PDF, reading the image from its archive bundle if it was archived"""
+    with local_copy(report_fields["image_path"]) as image_path:
+        return generate_pdf_report(predicted_class=predicted_class, **dict(report_fields, image_path=image_path))
+
+
+async def _render_report(user: Dict[str, Any], prediction_id: int, prediction: Dict[str, Any]) -> Dict[str, Any]:
+    """Reuse a prediction's up-to-date PDF report or render and record a new one
+
+    Returns the report id, its file path and whether an existing file was reused.
+    """
+    image_path = os.path.join(UPLOAD_DIR, prediction["image_name"])
+    
+    report_fields = dict(
+        username=user["username"],
+        image_path=image_path,
+        predicted_class_display=prediction["predicted_class"],
+        confidence=prediction["confidence"],
+        treatment=prediction["treatment"],
+        medicine=prediction["medicine"],
+        date=prediction["created_at"]
+    )
+    archived_image = None if os.path.exists(image_path) else await db.get_archived_file(image_path)
+    render_key = compute_render_key(
+        archived_image_mtime=archived_image["mtime"] if archived_image else None, **report_fields
+    )
+    
+    # Reuse the existing report when nothing that it renders has changed
+    existing = await db.get_report_for_prediction(prediction_id, REPORT_TEMPLATE_VERSION)
+    if (
+        existing
+        and existing["render_key"] == render_key
+        and os.path.exists(existing["file_path"])
+    ):
+        return {"report_id": existing["id"], "file_path": existing["file_path"], "cached": True}
+    
+    with stage("render_pdf"):
+        _, filepath = await run_in_threadpool(_render_pdf, prediction["predicted_class"], **report_fields)
+    
+    # Save report to database, replacing any stale render
+    report_id = await db.upsert_report(
+        user["id"], prediction_id, REPORT_TEMPLATE_VERSION, render_key, filepath
+    )
+    if existing and existing["file_path"] != filepath and os.path.exists(existing["file_path"]):
+        os.remove(existing["file_path"])
+    
+    return {"report_id": report_id, "file_path": filepath, "cached": False}
+
+
 # API Endpoints
 
 @app.get("/")
@@ -165,7 +442,7 @@ async def register(request: RegisterRequest):
     """Register new user"""
     try:
         # Check if user already exists
-        existing_user = get_user_by_email(request.email)
+        existing_user = await db.get_user_by_email(request.email)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -174,7 +451,7 @@ async def register(request: RegisterRequest):
         
         # Hash password and create user
         password_hash = hash_password(request.password)
-        user_id = create_user(request.email, request.username, password_hash)
+        user_id = await db.create_user(request.email, request.username, password_hash)
         
         # Create access token
         access_token = create_access_token({"user_id": user_id, "email": request.email})
@@ -200,7 +477,7 @@ async def login(request: LoginRequest):
     """Login user"""
     try:
         # Get user by email
-        user = get_user_by_email(request.email)
+        user = await db.get_user_by_email(request.email)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -236,6 +513,15 @@ async def login(request: LoginRequest):
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(
     file: UploadFile = File(...),
+    tiled: bool = Query(False, description="Score large field/drone images as overlapping tiles"),
+    tta: Optional[str] = Query(
+        None, pattern="^(off|auto|always)$",
+        description="Test-time augmentation: off, auto (low-confidence images only) or always"
+    ),
+    priority: str = Query(
+        "interactive", pattern="^(interactive|bulk)$",
+        description="Scheduling lane; bulk uploads should use bulk"
+    ),
     authorization: Optional[str] = Header(None)
 ):
     """Predict plant disease from uploaded image"""
@@ -243,38 +529,65 @@ async def predict(
         print(f"[PREDICT] Received file: {file.filename}, content_type: {file.content_type}")
         
         # Get current user
-        user = get_current_user(authorization)
+        user = await get_current_user(authorization)
         print(f"[PREDICT] User authenticated: {user['id']}")
         
-        # Save uploaded file
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
+        # Users who have used up half their burst are treated as bulk traffic
+        rate_limiter.acquire(user["id"])
+        if rate_limiter.level(user["id"]) < 0.5:
+            priority = "bulk"
+        
+        # Save uploaded file under a unique name so files are never overwritten
+        stem, ext = os.path.splitext(os.path.basename(file.filename or "upload"))
+        image_name = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+        file_path = os.path.join(UPLOAD_DIR, image_name)
+        with stage("save_upload"), open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         print(f"[PREDICT] File saved to: {file_path}")
         
         # Predict disease
         print(f"[PREDICT] Running prediction...")
-        result = predict_disease(file_path)
+        try:
+            async with inference_scheduler.slot(user["id"], priority):
+                with stage("inference"):
+                    result = await run_in_threadpool(
+                        predict_disease, file_path, tiled, ENABLE_EMBEDDINGS and not tiled, tta
+                    )
+        except AdmissionRejected:
+            os.remove(file_path)
+            raise
+        embedding = result.pop("embedding", None)
         print(f"[PREDICT] Prediction result: {result}")
         
         if not result["success"]:
             error_msg = result.get('error', 'Unknown error')
             print(f"[PREDICT] Prediction failed: {error_msg}")
+            # Nothing is recorded for a rejected or failed image, so its upload would be orphaned
+            os.remove(file_path)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Prediction failed: {error_msg}"
             )
         
-        # Save prediction to database
-        prediction_id = save_prediction(
+        # Queue prediction for a grouped commit; off the loop in case a new
+        # id block has to be reserved
+        prediction_id = await run_in_threadpool(
+            prediction_writer.submit,
             user_id=user["id"],
-            image_name=file.filename,
+            image_name=image_name,
             predicted_class=result["predicted_class"],
             confidence=result["confidence"],
             treatment=result["treatment"],
             medicine=result["medicine"]
         )
-        print(f"[PREDICT] Prediction saved with ID: {prediction_id}")
+        print(f"[PREDICT] Prediction queued with ID: {prediction_id}")
+        
+        if embedding is not None:
+            try:
+                with stage("embedding"):
+                    await run_in_threadpool(embedding_index.add, prediction_id, embedding)
+            except Exception as e:
+                print(f"[PREDICT] Embedding not stored: {str(e)}")
         
         return {
             "predicted_class": result["predicted_class"],
@@ -282,7 +595,10 @@ async def predict(
             "confidence": result["confidence"],
             "treatment": result["treatment"],
             "medicine": result["medicine"],
-            "prediction_id": prediction_id
+            "prediction_id": prediction_id,
+            "tiles": result.get("tiles"),
+            "quality": result.get("quality"),
+            "tta": result.get("tta")
         }
     
     except HTTPException:
@@ -297,15 +613,84 @@ async def predict(
         )
 
 
+@app.websocket("/ws/stream")
+async def stream_predictions(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None)
+):
+    """Predict plant disease on a live feed of JPEG frames
+
+    Each binary message is one frame. Results are pushed back as JSON as
+    soon as their batch finishes; near-duplicate and stale frames are
+    dropped rather than queued. Stream results are not saved.
+    """
+    try:
+        user = await get_current_user(authorization or (f"Bearer {token}" if token else None))
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+
+    await websocket.accept()
+    print(f"[STREAM] User {user['id']} connected")
+    stream = FrameStream(
+        batch_size=STREAM_BATCH_SIZE,
+        max_age_ms=STREAM_MAX_FRAME_AGE_MS,
+        duplicate_distance=STREAM_DUPLICATE_DISTANCE
+    )
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if not data or len(data) > STREAM_MAX_FRAME_BYTES:
+                    stream.stats["received"] += 1
+                    stream.stats["invalid"] += 1
+                    continue
+                stream.offer(data)
+        finally:
+            stream.end()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            batch = await stream.next_batch()
+            if batch is None:
+                break
+            try:
+                async with inference_scheduler.slot(user["id"], "interactive"):
+                    results = await stream.infer(batch)
+            except AdmissionRejected:
+                stream.stats["stale"] += len(batch)
+                continue
+            for result in results:
+                await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[STREAM] ERROR: {str(e)}")
+    finally:
+        receiver.cancel()
+        stream.close()
+        print(f"[STREAM] User {user['id']} disconnected: {stream.stats}")
+
+
 @app.get("/reports")
-async def get_reports(authorization: Optional[str] = Header(None)):
+async def get_reports(request: Request, response: Response, authorization: Optional[str] = Header(None)):
     """Get all reports for current user"""
     try:
         # Get current user
-        user = get_current_user(authorization)
+        user = await get_current_user(authorization)
+        
+        not_modified = await _not_modified(request, response, user["id"])
+        if not_modified:
+            return not_modified
         
         # Get user reports
-        reports = get_user_reports(user["id"])
+        reports = await db.get_user_reports(user["id"])
         
         return {
             "success": True,
@@ -322,14 +707,18 @@ async def get_reports(authorization: Optional[str] = Header(None)):
 
 
 @app.get("/predictions")
-async def get_predictions(authorization: Optional[str] = Header(None)):
+async def get_predictions(request: Request, response: Response, authorization: Optional[str] = Header(None)):
     """Get all predictions for current user"""
     try:
         # Get current user
-        user = get_current_user(authorization)
+        user = await get_current_user(authorization)
+        
+        not_modified = await _not_modified(request, response, user["id"])
+        if not_modified:
+            return not_modified
         
         # Get user predictions
-        predictions = get_user_predictions(user["id"])
+        predictions = await db.get_user_predictions(user["id"])
         
         return {
             "success": True,
@@ -346,15 +735,65 @@ async def get_predictions(authorization: Optional[str] = Header(None)):
         )
 
 
+@app.get("/export/predictions")
+async def export_predictions(
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    predicted_class: Optional[str] = None,
+    compress: bool = Query(False, description="gzip the stream (codec for parquet)"),
+    authorization: Optional[str] = Header(None)
+):
+    """Stream the current user's prediction history in chunks"""
+    try:
+        # Get current user
+        user = await get_current_user(authorization)
+        
+        export_format = format.lower()
+        if export_format not in EXPORT_MEDIA_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported export format: {format}"
+            )
+        
+        batches = iter_user_prediction_batches(
+            user["id"],
+            start_date=start_date.isoformat() if start_date else None,
+            end_date=end_date.isoformat() if end_date else None,
+            predicted_class=predicted_class
+        )
+        chunks = stream_export(batches, export_format, gzip=compress)
+        
+        filename = f"predictions.{export_format}"
+        media_type = EXPORT_MEDIA_TYPES[export_format]
+        if compress and export_format != "parquet":
+            filename += ".gz"
+            media_type = "application/gzip"
+        
+        return StreamingResponse(
+            chunks,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Export failed: {str(e)}"
+        )
+
+
 @app.post("/generate-report/{prediction_id}")
 async def generate_report(prediction_id: int, authorization: Optional[str] = Header(None)):
     """Generate PDF report for a prediction"""
     try:
         # Get current user
-        user = get_current_user(authorization)
+        user = await get_current_user(authorization)
         
-        # Get prediction
-        prediction = get_prediction_by_id(prediction_id)
+        # Get prediction (may still be waiting in the write-behind queue)
+        prediction = prediction_writer.get_pending(prediction_id) or await db.get_prediction_by_id(prediction_id)
         if not prediction:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -367,29 +806,14 @@ async def generate_report(prediction_id: int, authorization: Optional[str] = Hea
                 detail="Unauthorized access to this prediction"
             )
         
-        # Get image path
-        image_path = os.path.join(UPLOAD_DIR, prediction["image_name"])
-        
-        # Generate PDF report
-        filename, filepath = generate_pdf_report(
-            username=user["username"],
-            image_path=image_path,
-            predicted_class=prediction["predicted_class"],
-            predicted_class_display=prediction["predicted_class"],
-            confidence=prediction["confidence"],
-            treatment=prediction["treatment"],
-            medicine=prediction["medicine"],
-            date=prediction["created_at"]
-        )
-        
-        # Save report to database
-        report_id = save_report(user["id"], prediction_id, filepath)
+        report = await _render_report(user, prediction_id, prediction)
         
         return {
             "success": True,
-            "report_id": report_id,
-            "filename": filename,
-            "message": "Report generated successfully"
+            "report_id": report["report_id"],
+            "filename": os.path.basename(report["file_path"]),
+            "cached": report["cached"],
+            "message": "Report already up to date" if report["cached"] else "Report generated successfully"
         }
     
     except HTTPException:
@@ -401,15 +825,147 @@ async def generate_report(prediction_id: int, authorization: Optional[str] = Hea
         )
 
 
+@app.get("/similar/{prediction_id}")
+async def similar_predictions(
+    prediction_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    authorization: Optional[str] = Header(None)
+):
+    """Find past predictions whose images look most like this one"""
+    user = await get_current_user(authorization)
+    
+    if embedding_index is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Similar-case search is not enabled"
+        )
+    
+    prediction = prediction_writer.get_pending(prediction_id) or await db.get_prediction_by_id(prediction_id)
+    if not prediction:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Prediction not found"
+        )
+    
+    if prediction["user_id"] != user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Unauthorized access to this prediction"
+        )
+    
+    matches = await run_in_threadpool(embedding_index.search, prediction_id, limit)
+    if matches is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No embedding stored for this prediction"
+        )
+    
+    # Other users' cases are shown without their image names
+    rows = await db.get_predictions_by_ids([match_id for match_id, _ in matches])
+    class_names = get_class_names()
+    similar = []
+    for match_id, similarity in matches:
+        row = rows.get(match_id) or prediction_writer.get_pending(match_id)
+        if row is None:
+            continue
+        own = row["user_id"] == user["id"]
+        similar.append({
+            "prediction_id": match_id,
+            "similarity": similarity,
+            "predicted_class": row["predicted_class"],
+            "predicted_class_display": class_names.get(row["predicted_class"], row["predicted_class"]),
+            "confidence": row["confidence"],
+            "created_at": row["created_at"],
+            "own": own,
+            "image_name": row["image_name"] if own else None
+        })
+    
+    return {
+        "success": True,
+        "prediction_id": prediction_id,
+        "similar": similar
+    }
+
+
+@app.post("/generate-field-report")
+async def generate_field_report_endpoint(
+    request: FieldReportRequest,
+    authorization: Optional[str] = Header(None)
+):
+    """Generate one consolidated PDF for a list or date range of predictions"""
+    try:
+        # Get current user
+        user = await get_current_user(authorization)
+        
+        if request.prediction_ids is None and request.start_date is None and request.end_date is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Provide prediction_ids or a start_date/end_date range"
+            )
+        
+        filters = dict(
+            prediction_ids=request.prediction_ids,
+            start_date=request.start_date.isoformat() if request.start_date else None,
+            end_date=request.end_date.isoformat() if request.end_date else None
+        )
+        
+        disease_counts = await db.get_prediction_class_counts(user["id"], **filters)
+        if not disease_counts:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No predictions match the requested selection"
+            )
+        
+        period = (
+            f"{filters['start_date'] or 'beginning'} to {filters['end_date'] or 'today'}"
+            if request.start_date or request.end_date else "Selected predictions"
+        )
+        
+        # Rows are read from the cursor as pages are laid out; the finished
+        # PDF is spooled to a temporary file and streamed back in chunks.
+        output = tempfile.TemporaryFile()
+        try:
+            with stage("render_pdf"):
+                await run_in_threadpool(
+                    generate_field_report,
+                    username=user["username"],
+                    predictions=iter_user_predictions(user["id"], **filters),
+                    disease_counts=disease_counts,
+                    output=output,
+                    image_dir=UPLOAD_DIR,
+                    period=period,
+                    class_names=get_class_names(),
+                    resolve_image=local_copy
+                )
+        except Exception:
+            output.close()
+            raise
+        
+        filename = f"field_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        return StreamingResponse(
+            _iter_file_chunks(output),
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Field report generation failed: {str(e)}"
+        )
+
+
 @app.get("/download-report/{report_id}")
 async def download_report(report_id: int, authorization: Optional[str] = Header(None)):
     """Download PDF report"""
     try:
         # Get current user
-        user = get_current_user(authorization)
+        user = await get_current_user(authorization)
         
         # Get report
-        report = get_report_by_id(report_id)
+        report = await db.get_report_by_id(report_id)
         if not report:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -422,18 +978,23 @@ async def download_report(report_id: int, authorization: Optional[str] = Header(
                 detail="Unauthorized access to this report"
             )
         
-        # Check if file exists
-        if not os.path.exists(report["file_path"]):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Report file not found"
-            )
+        # Archived (or otherwise missing) PDFs are rendered again on demand
+        file_path = report["file_path"]
+        if not os.path.exists(file_path):
+            prediction = await db.get_prediction_by_id(report["prediction_id"])
+            if not prediction:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Report file not found"
+                )
+            print(f"[REPORTS] Re-rendering report {report_id}: {file_path} is not on disk")
+            file_path = (await _render_report(user, report["prediction_id"], prediction))["file_path"]
         
         # Return file
         return FileResponse(
-            report["file_path"],
+            file_path,
             media_type="application/pdf",
-            filename=os.path.basename(report["file_path"])
+            filename=os.path.basename(file_path)
         )
     
     except HTTPException:
@@ -446,14 +1007,18 @@ async def download_report(report_id: int, authorization: Optional[str] = Header(
 
 
 @app.get("/user-stats")
-async def get_user_stats(authorization: Optional[str] = Header(None)):
+async def get_user_stats(request: Request, response: Response, authorization: Optional[str] = Header(None)):
     """Get user statistics"""
     try:
         # Get current user
-        user = get_current_user(authorization)
+        user = await get_current_user(authorization)
+        
+        not_modified = await _not_modified(request, response, user["id"])
+        if not_modified:
+            return not_modified
         
         # Get predictions
-        predictions = get_user_predictions(user["id"])
+        predictions = await db.get_user_predictions(user["id"])
         
         # Calculate stats
         total_predictions = len(predictions)
@@ -484,13 +1049,166 @@ async def get_user_stats(authorization: Optional[str] = Header(None)):
         )
 
 
+@app.get("/analytics/trends")
+async def analytics_trends(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    predicted_class: Optional[str] = None,
+    bucket: str = Query("day", description="day, week or month"),
+    authorization: Optional[str] = Header(None)
+):
+    """Get region-wide disease trends from the analytics store"""
+    try:
+        # Get current user
+        await get_current_user(authorization)
+        
+        if bucket not in TREND_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported bucket: {bucket}"
+            )
+        
+        trends = await run_in_threadpool(
+            get_disease_trends,
+            start_date=start_date.isoformat() if start_date else None,
+            end_date=end_date.isoformat() if end_date else None,
+            predicted_class=predicted_class,
+            bucket=bucket
+        )
+        
+        return {
+            "success": True,
+            "bucket": bucket,
+            "trends": trends
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to fetch trends: {str(e)}"
+        )
+
+
+@app.post("/admin/profile")
+async def profile(
+    seconds: float = Query(10, gt=0, description="Maximum length of the profiling session"),
+    requests: Optional[int] = Query(None, ge=1, description="Stop after this many requests finish"),
+    interval_ms: float = Query(5, ge=1, le=100, description="Sampling interval"),
+    include_idle: bool = Query(False, description="Keep samples of threads waiting for work"),
+    authorization: Optional[str] = Header(None)
+):
+    """Sample this API process and return collapsed stacks for a flamegraph"""
+    await get_admin_user(authorization)
+    if seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be at most {PROFILE_MAX_SECONDS}"
+        )
+    if profiler.active:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profiling session is already running"
+        )
+    
+    print(f"[PROFILE] Sampling for up to {seconds}s" + (f" or {requests} requests" if requests else ""))
+    result = await profiler.run(seconds, requests, interval_ms, include_idle)
+    print(f"[PROFILE] {result['samples']} samples, {result['requests']} requests in {result['seconds']}s")
+    
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={
+            "X-Profile-Seconds": str(result["seconds"]),
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Requests": str(result["requests"]),
+        }
+    )
+
+
+@app.get("/admin/slow-requests")
+async def get_slow_requests(
+    limit: int = Query(20, ge=1, le=500),
+    authorization: Optional[str] = Header(None)
+):
+    """Slowest recent requests with per-stage timings"""
+    await get_admin_user(authorization)
+    return {
+        "threshold_ms": slow_requests.threshold_ms,
+        "requests": slow_requests.slowest(limit)
+    }
+
+
+@app.post("/admin/maintenance")
+async def trigger_maintenance(
+    full_vacuum: bool = Query(False),
+    authorization: Optional[str] = Header(None)
+):
+    """Run storage archival and database maintenance now"""
+    await get_admin_user(authorization)
+    report = await run_in_threadpool(
+        run_maintenance, UPLOAD_DIR, get_reports_directory(), "manual", full_vacuum
+    )
+    if report is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Maintenance is already running"
+        )
+    return {"success": True, "report": report}
+
+
+@app.get("/admin/maintenance")
+async def get_maintenance_history(
+    limit: int = Query(10, ge=1, le=100),
+    authorization: Optional[str] = Header(None)
+):
+    """Recent maintenance runs with space reclaimed and query plan changes"""
+    await get_admin_user(authorization)
+    return {"success": True, "runs": await db.get_maintenance_runs(limit)}
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
+    health = {
         "status": "healthy",
         "timestamp": datetime.now().isoformat()
     }
+    
+    # Pre-filter counters live wherever the model runs
+    prefilter_stats = []
+
+    # Report standalone inference worker liveness when using the job queue
+    if INFERENCE_QUEUE:
+        from inference_queue import get_job_queue
+        try:
+            workers = await run_in_threadpool(get_job_queue(INFERENCE_QUEUE).workers)
+            alive = sum(1 for w in workers if w["alive"])
+            health["inference_workers"] = {"alive": alive, "known": len(workers)}
+            prefilter_stats = [w["prefilter"] for w in workers if w["alive"] and "prefilter" in w]
+            if alive == 0:
+                health["status"] = "degraded"
+        except Exception as e:
+            health["inference_workers"] = {"error": str(e)}
+            health["status"] = "degraded"
+    elif INFERENCE_SOCKET:
+        from inference_server import check_health
+        try:
+            server = await run_in_threadpool(check_health, INFERENCE_SOCKET)
+            prefilter_stats = [server["prefilter"]]
+        except Exception as e:
+            health["inference_server"] = {"error": str(e)}
+            health["status"] = "degraded"
+    else:
+        prefilter_stats = [get_prefilter_stats()]
+
+    health["scheduler"] = inference_scheduler.stats()
+    
+    if prefilter_stats:
+        totals = {key: sum(stats[key] for stats in prefilter_stats) for key in prefilter_stats[0]}
+        health["prefilter"] = summarize_prefilter_stats(totals)
+    
+    return health
 
 
 if __name__ == "__main__":
@@ -0,0 +1,383 @@
+"""
+Storage maintenance for AgroGuard AI
+Retention-based archival of uploads and reports into compressed bundles,
+and incremental VACUUM / ANALYZE of the SQLite database off-peak
+"""
+
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+import database
+from utils.report_generator import REPORT_TEMPLATE_VERSION
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Age (days) after which files leave the hot directories; 0 disables a policy
+UPLOAD_RETENTION_DAYS = float(os.getenv("UPLOAD_RETENTION_DAYS", "90"))
+REPORT_RETENTION_DAYS = float(os.getenv("REPORT_RETENTION_DAYS", "30"))
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "0"))
+
+# Local time range for scheduled runs, e.g. "02:00-05:00" (may wrap midnight)
+MAINTENANCE_WINDOW = os.getenv("MAINTENANCE_WINDOW", "02:00-05:00")
+
+# Free pages released per incremental_vacuum step; writers get the lock in between
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "1000"))
+
+BUNDLE_MAX_BYTES = 256 * 1024 * 1024
+
+# Already-compressed formats are stored as-is; deflating them only costs CPU
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+# Representative application queries whose plans and timings are compared
+# around ANALYZE
+PLAN_QUERIES = {
+    "user_predictions": (
+        "SELECT * FROM predictions WHERE user_id = :user_id ORDER BY created_at DESC"
+    ),
+    "user_predictions_since": (
+        "SELECT * FROM predictions WHERE user_id = :user_id AND created_at >= :since "
+        "ORDER BY created_at, id"
+    ),
+    "user_class_counts": (
+        "SELECT predicted_class, COUNT(*) AS count FROM predictions "
+        "WHERE user_id = :user_id GROUP BY predicted_class"
+    ),
+    "user_reports": (
+        "SELECT reports.*, predictions.predicted_class, predictions.confidence FROM reports "
+        "JOIN predictions ON reports.prediction_id = predictions.id "
+        "WHERE reports.user_id = :user_id ORDER BY reports.created_at DESC"
+    ),
+    "report_for_prediction": (
+        "SELECT * FROM reports WHERE prediction_id = :prediction_id AND template_version = :template_version"
+    ),
+}
+
+
+# ---------------- SCHEDULE ---------------- #
+
+def _minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _parse_window(spec: str) -> Tuple[int, int]:
+    start, end = spec.split("-")
+    return _minutes(start), _minutes(end)
+
+
+def window_bounds(now: datetime, spec: Optional[str] = None) -> Optional[Tuple[datetime, datetime]]:
+    """Start and end of the maintenance window containing `now`, or None outside it"""
+    start, end = _parse_window(spec or MAINTENANCE_WINDOW)
+    minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if start <= end:
+        if not start <= minute < end:
+            return None
+        day = midnight
+    elif minute >= start:
+        day = midnight
+    elif minute < end:
+        day = midnight - timedelta(days=1)
+    else:
+        return None
+    opens = day + timedelta(minutes=start)
+    closes = day + timedelta(minutes=end if start <= end else end + 24 * 60)
+    return opens, closes
+
+
+@contextmanager
+def _exclusive_lock():
+    """Yield True if this process got the maintenance lock, False if another holds it"""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, "maintenance.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+# ---------------- ARCHIVE ---------------- #
+
+def _bundle_path(bundle: str) -> str:
+    return os.path.join(ARCHIVE_DIR, bundle)
+
+
+def _write_bundle(bundle: str, entries: List[os.DirEntry]) -> int:
+    """Write files into a new zip bundle atomically; returns the bundle size"""
+    path = _bundle_path(bundle)
+    tmp = path + ".tmp"
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for entry in entries:
+            stored = entry.name.lower().endswith(STORED_EXTENSIONS)
+            zf.write(entry.path, entry.name, compress_type=zipfile.ZIP_STORED if stored else None)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def archive_aged_files(directory: str, kind: str, max_age_days: float) -> Dict[str, Any]:
+    """Move files older than `max_age_days` from `directory` into bundles
+
+    Originals are removed only after their bundle is on disk and indexed
+    in archived_files, so an interrupted run at worst archives a file twice.
+    """
+    result = {"files": 0, "bytes": 0, "bundle_bytes": 0, "bundles": []}
+    if max_age_days <= 0 or not os.path.isdir(directory):
+        return result
+
+    cutoff = time.time() - max_age_days * 86400
+    aged = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and not entry.name.startswith(".") and entry.stat().st_mtime < cutoff:
+            aged.append(entry)
+    aged.sort(key=lambda entry: entry.stat().st_mtime)
+
+    batches, batch, batch_bytes = [], [], 0
+    for entry in aged:
+        if batch and batch_bytes + entry.stat().st_size > BUNDLE_MAX_BYTES:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(entry)
+        batch_bytes += entry.stat().st_size
+    if batch:
+        batches.append(batch)
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    for number, batch in enumerate(batches, 1):
+        bundle = f"{kind}_{stamp}_{number:03d}.zip"
+        result["bundle_bytes"] += _write_bundle(bundle, batch)
+        database.record_archived_files(bundle, [
+            (os.path.normpath(entry.path), entry.stat().st_size, entry.stat().st_mtime)
+            for entry in batch
+        ])
+        for entry in batch:
+            result["bytes"] += entry.stat().st_size
+            os.remove(entry.path)
+        result["files"] += len(batch)
+        result["bundles"].append(bundle)
+
+    return result
+
+
+def delete_expired_bundles(max_age_days: float) -> Dict[str, Any]:
+    """Delete bundles older than `max_age_days`; their files are gone for good"""
+    result = {"bundles": 0, "files": 0, "bytes": 0}
+    if max_age_days <= 0 or not os.path.isdir(ARCHIVE_DIR):
+        return result
+
+    cutoff = time.time() - max_age_days * 86400
+    for entry in os.scandir(ARCHIVE_DIR):
+        if entry.name.endswith(".zip") and entry.stat().st_mtime < cutoff:
+            size = entry.stat().st_size
+            result["files"] += database.delete_archived_bundle(entry.name)
+            os.remove(entry.path)
+            result["bundles"] += 1
+            result["bytes"] += size
+    return result
+
+
+@contextmanager
+def local_copy(path: str):
+    """Yield a readable path for a file that may have been archived
+
+    Archived files are extracted to a temporary file that is deleted
+    afterwards. If the file is neither present nor archived, `path` is
+    yielded unchanged.
+    """
+    archived = None if os.path.exists(path) else database.get_archived_file(path)
+    if archived is None or not os.path.exists(_bundle_path(archived["bundle"])):
+        yield path
+        return
+
+    suffix = os.path.splitext(path)[1]
+    with zipfile.ZipFile(_bundle_path(archived["bundle"])) as zf, \
+            tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        with zf.open(os.path.basename(path)) as member:
+            shutil.copyfileobj(member, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+# ---------------- DATABASE ---------------- #
+
+def _db_size() -> int:
+    return sum(
+        os.path.getsize(path)
+        for path in (database.DATABASE_PATH, database.DATABASE_PATH + "-wal")
+        if os.path.exists(path)
+    )
+
+
+def _plan_params(conn) -> Dict[str, Any]:
+    busiest = conn.execute(
+        "SELECT user_id FROM predictions GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()
+    latest = conn.execute("SELECT MAX(id) FROM predictions").fetchone()
+    return {
+        "user_id": busiest[0] if busiest else 0,
+        "since": (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d"),
+        "prediction_id": latest[0] or 0,
+        "template_version": REPORT_TEMPLATE_VERSION,
+    }
+
+
+def _query_plans(conn, params: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """EXPLAIN QUERY PLAN and best-of-3 wall time of each PLAN_QUERIES entry"""
+    plans = {}
+    for name, sql in PLAN_QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - started)
+        plans[name] = {"plan": plan, "ms": round(min(timings) * 1000, 3)}
+    return plans
+
+
+def optimize_database(deadline: Optional[float] = None, allow_full_vacuum: bool = False) -> Dict[str, Any]:
+    """Reclaim free pages in small steps, then ANALYZE and compare query plans
+
+    Incremental vacuum needs auto_vacuum=INCREMENTAL, which an existing
+    database only adopts through one full VACUUM that blocks writers; it
+    is done only with `allow_full_vacuum`, otherwise reclamation is skipped
+    until then. Runs release VACUUM_STEP_PAGES per step, pausing between
+    steps so request writes are not held up, and stop at `deadline`
+    (a time.time() value).
+    """
+    conn = database.get_connection()
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        size_before = _db_size()
+
+        started = time.perf_counter()
+        converted = False
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if not incremental and allow_full_vacuum:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            converted = incremental = True
+        elif incremental:
+            while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                # executescript steps the pragma to completion; execute() frees one page
+                conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+                time.sleep(0.05)
+        vacuum_seconds = time.perf_counter() - started
+
+        params = _plan_params(conn)
+        before = _query_plans(conn, params)
+        started = time.perf_counter()
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE")
+        conn.commit()
+        analyze_seconds = time.perf_counter() - started
+        after = _query_plans(conn, params)
+
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+
+    size_after = _db_size()
+    return {
+        "size_before": size_before,
+        "size_after": size_after,
+        "reclaimed_bytes": size_before - size_after,
+        "free_pages_before": free_before,
+        "free_pages_after": free_after,
+        "page_size": page_size,
+        "converted_to_incremental": converted,
+        "vacuum_skipped": not incremental,
+        "vacuum_seconds": round(vacuum_seconds, 3),
+        "analyze_seconds": round(analyze_seconds, 3),
+        "query_plans": [
+            {
+                "query": name,
+                "plan_before": before[name]["plan"],
+                "plan_after": after[name]["plan"],
+                "changed": before[name]["plan"] != after[name]["plan"],
+                "ms_before": before[name]["ms"],
+                "ms_after": after[name]["ms"],
+            }
+            for name in PLAN_QUERIES
+        ],
+    }
+
+
+# ---------------- RUN ---------------- #
+
+def _run(upload_dir: str, reports_dir: str, deadline: Optional[float],
+         allow_full_vacuum: bool) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    steps = (
+        ("uploads", lambda: archive_aged_files(upload_dir, "uploads", UPLOAD_RETENTION_DAYS)),
+        ("reports", lambda: archive_aged_files(reports_dir, "reports", REPORT_RETENTION_DAYS)),
+        ("expired_bundles", lambda: delete_expired_bundles(ARCHIVE_RETENTION_DAYS)),
+        ("database", lambda: optimize_database(deadline, allow_full_vacuum)),
+    )
+    # One failing step (e.g. a locked database) does not stop the others
+    for name, step in steps:
+        try:
+            report[name] = step()
+        except Exception as e:
+            print(f"[MAINTENANCE] {name} failed: {str(e)}")
+            report[name] = {"error": str(e)}
+
+    moved = sum(report[kind].get("bytes", 0) for kind in ("uploads", "reports"))
+    added = sum(report[kind].get("bundle_bytes", 0) for kind in ("uploads", "reports"))
+    report["hot_storage_freed_bytes"] = moved + max(report["database"].get("reclaimed_bytes", 0), 0)
+    report["reclaimed_bytes"] = (
+        report["hot_storage_freed_bytes"] - added + report["expired_bundles"].get("bytes", 0)
+    )
+    return report
+
+
+def run_maintenance(upload_dir: str, reports_dir: str, trigger: str = "manual",
+                    full_vacuum: bool = False) -> Optional[Dict[str, Any]]:
+    """Archive aged files and optimise the database, recording the outcome
+
+    Scheduled runs happen at most once per maintenance window and may do
+    the one-off full VACUUM that enables incremental vacuum; manual runs
+    only do it with `full_vacuum`. Returns None if another process is
+    running maintenance, or if a scheduled run is not due.
+    """
+    now = datetime.now()
+    deadline = None
+    if trigger == "scheduled":
+        window = window_bounds(now)
+        if window is None:
+            return None
+        deadline = window[1].timestamp()
+
+    with _exclusive_lock() as acquired:
+        if not acquired:
+            return None
+        if trigger == "scheduled":
+            last = database.get_maintenance_runs(1, trigger="scheduled")
+            if last and datetime.fromisoformat(last[0]["started_at"]) >= window[0]:
+                return None
+
+        print(f"[MAINTENANCE] Starting {trigger} run")
+        report = _run(upload_dir, reports_dir, deadline, full_vacuum or trigger == "scheduled")
+        finished = datetime.now()
+        report["run_id"] = database.save_maintenance_run(
+            now.isoformat(), finished.isoformat(), trigger, report
+        )
+    print(
+        f"[MAINTENANCE] Archived {report['uploads'].get('files', 0)} upload(s) and "
+        f"{report['reports'].get('files', 0)} report(s); reclaimed {report['reclaimed_bytes']} bytes "
+        f"in {(finished - now).total_seconds():.1f}s"
+    )
+    return report
@@ -4,10 +4,16 @@ Load and manage Keras model
 """
 
 import os
-from typing import Dict, Any
+import json
+import threading
+import time
+from typing import Dict, Any, List, Optional
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image as keras_image
+
+from profiling import stage
+
+# TensorFlow is imported lazily so API workers that forward inference to
+# a shared inference server (see inference_server.py) never load it.
 
 # ---------------- MODEL PATH RESOLUTION ---------------- #
 
@@ -31,6 +37,31 @@ else:
 # Global model instance
 _model = None
 
+# Same model with the penultimate layer exposed as a second output
+_embedding_model = None
+
+# When set, predictions are forwarded to the inference server on this socket
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+
+# When set, predictions are queued for standalone inference workers
+INFERENCE_QUEUE = os.getenv("INFERENCE_QUEUE")
+
+# Thread/affinity settings written by autotune.py
+INFERENCE_CONFIG_PATH = os.getenv(
+    "INFERENCE_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_config.json")
+)
+
+# Held for the life of the process to keep this worker's CPU slot
+_cpu_slot_lock = None
+
+# Which section of the inference config this process uses: "replicas" when
+# it is one of several model copies on the node (in-process API workers,
+# queue workers), "shared" for the single inference server
+SERVING_MODES = ("replicas", "shared")
+_serving_mode = "replicas"
+_inference_config: Optional[Dict[str, Any]] = None
+
 # ---------------- CLASS NAMES ---------------- #
 
 CLASS_NAMES = {
@@ -116,6 +147,105 @@ DISEASE_INFO = {
     },
 }
 
+# ---------------- INFERENCE CONFIG ---------------- #
+
+def load_inference_config(path: Optional[str] = None, mode: str = "replicas") -> Dict[str, Any]:
+    """Read one serving mode's section of the autotuned config, or {} when there is none
+
+    Files written before configs were split by mode hold replica settings
+    only; a shared server then keeps TensorFlow's whole-machine defaults.
+    """
+    if mode not in SERVING_MODES:
+        raise ValueError(f"Unknown serving mode: {mode}")
+    path = INFERENCE_CONFIG_PATH if path is None else path
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        config = json.load(f)
+    if not any(key in config for key in SERVING_MODES):
+        return config if mode == "replicas" else {}
+    return config.get(mode) or {}
+
+
+def set_serving_mode(mode: str):
+    """Choose this process's config section; call before the model loads"""
+    global _serving_mode, _inference_config
+    if mode not in SERVING_MODES:
+        raise ValueError(f"Unknown serving mode: {mode}")
+    _serving_mode = mode
+    _inference_config = None
+
+
+def get_inference_config() -> Dict[str, Any]:
+    """This process's inference config, read from disk once"""
+    global _inference_config
+    if _inference_config is None:
+        _inference_config = load_inference_config(mode=_serving_mode)
+    return _inference_config
+
+
+def cpu_topology_order() -> List[int]:
+    """Usable CPUs ordered so hyperthread siblings of one core are adjacent"""
+    cpus = sorted(os.sched_getaffinity(0))
+
+    def core_key(cpu: int):
+        base = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{base}/physical_package_id") as f:
+                package = int(f.read())
+            with open(f"{base}/core_id") as f:
+                core = int(f.read())
+        except (OSError, ValueError):
+            return (0, cpu, cpu)
+        return (package, core, cpu)
+
+    return sorted(cpus, key=core_key)
+
+
+def pin_worker_cpus(cores_per_worker: int) -> Optional[List[int]]:
+    """Pin this process to the first free block of `cores_per_worker` CPUs
+
+    Slots are claimed with a non-blocking flock on /tmp files, so workers
+    started independently (uvicorn, inference_worker.py) get disjoint CPU
+    sets, and a crashed worker's slot is released automatically.
+    """
+    global _cpu_slot_lock
+    import fcntl
+
+    cpus = cpu_topology_order()
+    for slot in range(len(cpus) // cores_per_worker):
+        lock = open(f"/tmp/agroguard-cpu-slot-{slot}.lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        _cpu_slot_lock = lock
+        block = cpus[slot * cores_per_worker:(slot + 1) * cores_per_worker]
+        os.sched_setaffinity(0, block)
+        return block
+    return None
+
+
+def apply_inference_config(config: Optional[Dict[str, Any]] = None):
+    """Apply thread pool sizes and CPU pinning; must run before TensorFlow executes anything"""
+    config = get_inference_config() if config is None else config
+    if not config:
+        return
+
+    if config.get("cpu_affinity") and config.get("intra_op_threads"):
+        cpus = pin_worker_cpus(config["intra_op_threads"])
+        if cpus:
+            print(f"Pinned to CPUs {cpus}")
+
+    import tensorflow as tf
+
+    if config.get("intra_op_threads"):
+        tf.config.threading.set_intra_op_parallelism_threads(config["intra_op_threads"])
+    if config.get("inter_op_threads"):
+        tf.config.threading.set_inter_op_parallelism_threads(config["inter_op_threads"])
+
+
 # ---------------- MODEL LOADER ---------------- #
 
 def load_keras_model():
@@ -125,6 +255,10 @@ def load_keras_model():
         if not os.path.exists(MODEL_PATH):
             raise FileNotFoundError(f"Model file not found at {MODEL_PATH}")
 
+        apply_inference_config()
+
+        from tensorflow.keras.models import load_model
+
         print(f"Loading model from {MODEL_PATH}...")
         _model = load_model(MODEL_PATH, compile=False)
         print("Model loaded successfully!")
@@ -132,9 +266,31 @@ def load_keras_model():
     return _model
 
 
+def load_embedding_model():
+    """Model returning (penultimate features, class probabilities) in one forward pass"""
+    global _embedding_model
+
+    if _embedding_model is None:
+        from tensorflow import keras
+
+        model = load_keras_model()
+        _embedding_model = keras.Model(model.inputs, [model.layers[-1].input, model.output])
+
+    return _embedding_model
+
+
+def warm_up_model(target_size: tuple = (224, 224)):
+    """Load the model and run one dummy forward pass so the first request is not slow"""
+    model = load_keras_model()
+    model.predict(np.zeros((1, *target_size, 3), dtype=np.float32), verbose=0)
+    return model
+
+
 # ---------------- IMAGE PREPROCESSING ---------------- #
 
 def preprocess_image(image_path: str, target_size: tuple = (224, 224)) -> np.ndarray:
+    from tensorflow.keras.preprocessing import image as keras_image
+
     img = keras_image.load_img(image_path, target_size=target_size)
     img_array = keras_image.img_to_array(img)
     img_array = img_array / 255.0
@@ -142,47 +298,457 @@ def preprocess_image(image_path: str, target_size: tuple = (224, 224)) -> np.nda
     return img_array
 
 
+def load_image_array(image_path: str, max_side: Optional[int] = None) -> np.ndarray:
+    """Load an image as an HxWx3 uint8 array, downscaled to fit `max_side` if given
+
+    Downscaling happens before the pixels are decoded, so JPEGs are decoded
+    straight at the reduced scale.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.BILINEAR)
+        return np.asarray(img.convert("RGB"), dtype=np.uint8)
+
+
+def _tile_offsets(length: int, tile_size: int, stride: int) -> List[int]:
+    """Tile start offsets covering [0, length), with the last tile flush to the edge"""
+    offsets = list(range(0, length - tile_size + 1, stride))
+    if offsets[-1] != length - tile_size:
+        offsets.append(length - tile_size)
+    return offsets
+
+
+def vegetation_fraction(tiles: np.ndarray, threshold: int = 20, step: int = 4) -> np.ndarray:
+    """Fraction of leaf-coloured pixels per tile using the excess-green index
+
+    ExG = 2G - R - B on a strided subsample of each uint8 tile; one
+    vectorized pass over all tiles, far cheaper than a forward pass.
+    """
+    sample = tiles[:, ::step, ::step, :].astype(np.int16)
+    exg = 2 * sample[..., 1] - sample[..., 0] - sample[..., 2]
+    return (exg > threshold).mean(axis=(1, 2))
+
+
+# ---------------- QUALITY PRE-FILTER ---------------- #
+
+# "reject" answers bad images without running the model, "flag" runs the
+# model but marks the result, "off" skips the check. Rejecting is opt-in:
+# heavily necrotic leaves can fail the plant-fraction check
+QUALITY_FILTER = os.getenv("QUALITY_FILTER", "flag")
+
+QUALITY_THRESHOLDS = {
+    "min_sharpness": float(os.getenv("QUALITY_MIN_SHARPNESS", "10")),
+    "min_brightness": float(os.getenv("QUALITY_MIN_BRIGHTNESS", "30")),
+    "max_brightness": float(os.getenv("QUALITY_MAX_BRIGHTNESS", "235")),
+    "min_plant_fraction": float(os.getenv("QUALITY_MIN_PLANT_FRACTION", "0.05")),
+}
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32) * 255.0
+
+_prefilter_lock = threading.Lock()
+_prefilter_stats = {
+    "checked": 0,
+    "rejected": 0,
+    "flagged": 0,
+    "filter_seconds": 0.0,
+    "inferences": 0,
+    "inference_seconds": 0.0,
+}
+
+
+def assess_image_quality(img: np.ndarray) -> Dict[str, float]:
+    """Sharpness, brightness and plant fraction of an HxWx3 image scaled 0-1
+
+    Sharpness is the variance of the 4-neighbour Laplacian of the luma
+    channel and brightness its mean (both 0-255 scale); plant fraction is
+    the share of excess-green pixels. Runs on a 2x subsample of the model
+    input in a few vectorized passes, about 0.2 ms for 224x224.
+    """
+    sample = img[::2, ::2]
+    luma = sample @ _LUMA
+    laplacian = (
+        4 * luma[1:-1, 1:-1]
+        - luma[:-2, 1:-1] - luma[2:, 1:-1]
+        - luma[1:-1, :-2] - luma[1:-1, 2:]
+    )
+    exg = 2 * sample[..., 1] - sample[..., 0] - sample[..., 2]
+    return {
+        "sharpness": round(float(laplacian.var()), 2),
+        "brightness": round(float(luma.mean()), 2),
+        "plant_fraction": round(np.count_nonzero(exg > 20 / 255.0) / exg.size, 4),
+    }
+
+
+def quality_issues(quality: Dict[str, float]) -> List[str]:
+    """Reasons an image fails QUALITY_THRESHOLDS (empty if it passes)"""
+    issues = []
+    if quality["sharpness"] < QUALITY_THRESHOLDS["min_sharpness"]:
+        issues.append("too blurry")
+    if quality["brightness"] < QUALITY_THRESHOLDS["min_brightness"]:
+        issues.append("too dark")
+    elif quality["brightness"] > QUALITY_THRESHOLDS["max_brightness"]:
+        issues.append("overexposed")
+    if quality["plant_fraction"] < QUALITY_THRESHOLDS["min_plant_fraction"]:
+        issues.append("no plant detected")
+    return issues
+
+
+def _check_quality(img: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Run the pre-filter on a preprocessed image and count the outcome"""
+    if QUALITY_FILTER == "off":
+        return None
+
+    started = time.perf_counter()
+    quality = assess_image_quality(img)
+    quality["issues"] = quality_issues(quality)
+    quality["rejected"] = bool(quality["issues"]) and QUALITY_FILTER == "reject"
+    elapsed = time.perf_counter() - started
+
+    with _prefilter_lock:
+        _prefilter_stats["checked"] += 1
+        _prefilter_stats["filter_seconds"] += elapsed
+        if quality["rejected"]:
+            _prefilter_stats["rejected"] += 1
+        elif quality["issues"]:
+            _prefilter_stats["flagged"] += 1
+    return quality
+
+
+def _record_inference(seconds: float, images: int = 1):
+    with _prefilter_lock:
+        _prefilter_stats["inferences"] += images
+        _prefilter_stats["inference_seconds"] += seconds
+
+
+def get_prefilter_stats() -> Dict[str, Any]:
+    """Raw pre-filter counters for this process"""
+    with _prefilter_lock:
+        return dict(_prefilter_stats)
+
+
+def summarize_prefilter_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Add average costs and the inference time saved by rejections"""
+    inference_ms = stats["inference_seconds"] * 1000 / stats["inferences"] if stats["inferences"] else 0.0
+    filter_ms = stats["filter_seconds"] * 1000 / stats["checked"] if stats["checked"] else 0.0
+    return {
+        "mode": QUALITY_FILTER,
+        "checked": stats["checked"],
+        "rejected": stats["rejected"],
+        "flagged": stats["flagged"],
+        "avg_filter_ms": round(filter_ms, 3),
+        "avg_inference_ms": round(inference_ms, 2),
+        "inference_seconds_saved": round(stats["rejected"] * inference_ms / 1000, 3),
+    }
+
+
+def _rejected_result(quality: Dict[str, Any]) -> Dict[str, Any]:
+    result = _failure_result("Image rejected: " + ", ".join(quality["issues"]))
+    result["quality"] = quality
+    return result
+
+
+# ---------------- TEST-TIME AUGMENTATION ---------------- #
+
+# "auto" re-scores low-confidence images with augmented views, "always"
+# scores every image that way, "off" never does. Opt-in: it adds latency
+# and changes the reported confidence
+TTA_MODES = ("off", "auto", "always")
+TTA_MODE = os.getenv("TTA_MODE", "off")
+TTA_AUGMENTATIONS = int(os.getenv("TTA_AUGMENTATIONS", "8"))
+TTA_CONFIDENCE_THRESHOLD = float(os.getenv("TTA_CONFIDENCE_THRESHOLD", "0.6"))
+
+# 90% crops (y1, x1, y2, x2): centre, then the four corners
+_TTA_CROP_BOXES = np.array([
+    [0.05, 0.05, 0.95, 0.95],
+    [0.0, 0.0, 0.9, 0.9],
+    [0.0, 0.1, 0.9, 1.0],
+    [0.1, 0.0, 1.0, 0.9],
+    [0.1, 0.1, 1.0, 1.0],
+], dtype=np.float32)
+
+
+def tta_views(img: np.ndarray, count: int) -> np.ndarray:
+    """Up to `count` augmented views of an HxWx3 image, the original first
+
+    Order: original, horizontal flip, vertical flip, five 90% crops
+    resized back to full size, then horizontal flips of those crops.
+    """
+    views = [img, img[:, ::-1], img[::-1]]
+    if count > len(views):
+        import tensorflow as tf
+
+        crops = tf.image.crop_and_resize(
+            img[np.newaxis], _TTA_CROP_BOXES,
+            np.zeros(len(_TTA_CROP_BOXES), dtype=np.int32), img.shape[:2]
+        ).numpy()
+        views.extend(crops)
+        views.extend(crop[:, ::-1] for crop in crops)
+    return np.stack(views[:count])
+
+
 # ---------------- PREDICTION ---------------- #
 
-def predict_disease(image_path: str) -> Dict[str, Any]:
+def _prediction_result(class_idx: int, confidence: float) -> Dict[str, Any]:
+    """Successful predict_disease result for a class index"""
+    class_list = list(CLASS_NAMES.keys())
+    predicted_class = class_list[class_idx]
+    predicted_class_display = CLASS_NAMES.get(predicted_class, predicted_class)
+
+    disease_info = DISEASE_INFO.get(
+        predicted_class,
+        {
+            "treatment": "Consult agricultural expert",
+            "medicine": "Unknown"
+        }
+    )
+
+    return {
+        "predicted_class": predicted_class,
+        "predicted_class_display": predicted_class_display,
+        "confidence": confidence,
+        "treatment": disease_info.get("treatment", ""),
+        "medicine": disease_info.get("medicine", ""),
+        "success": True
+    }
+
+
+def _failure_result(error: str) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error": error,
+        "predicted_class": None,
+        "confidence": 0.0,
+        "treatment": "",
+        "medicine": ""
+    }
+
+
+def predict_disease_tiled(
+    image_path: str,
+    tile_size: int = 224,
+    overlap: float = 0.25,
+    max_tiles: int = 256,
+    min_leaf_fraction: float = 0.15,
+    min_disease_fraction: float = 0.05
+) -> Dict[str, Any]:
+    """Score a large field/drone image as overlapping tiles in one batched pass
+
+    Tiles with too little vegetation are skipped. The verdict is the disease
+    carrying the most probability mass over diseased tiles when at least
+    `min_disease_fraction` of leaf tiles are diseased, otherwise the mean
+    prediction. A per-tile heatmap is returned under "tiles".
+    """
+    from PIL import Image
+
+    model = load_keras_model()
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    # Size the tile grid from the header, then decode once at a scale that
+    # keeps it within max_tiles
+    with Image.open(image_path) as header:
+        width, height = header.size
+    tiles_at_full = (
+        len(_tile_offsets(max(height, tile_size), tile_size, stride))
+        * len(_tile_offsets(max(width, tile_size), tile_size, stride))
+    )
+    max_side = None
+    if tiles_at_full > max_tiles:
+        scale = (max_tiles / tiles_at_full) ** 0.5
+        max_side = max(tile_size, int(max(height, width) * scale))
+    img = load_image_array(image_path, max_side=max_side)
+    height, width = img.shape[:2]
+
+    if height < tile_size or width < tile_size:
+        result = predict_disease(image_path)
+        result["tiles"] = None
+        return result
+
+    ys = _tile_offsets(height, tile_size, stride)
+    xs = _tile_offsets(width, tile_size, stride)
+    windows = np.lib.stride_tricks.sliding_window_view(img, (tile_size, tile_size, 3))[:, :, 0]
+    tiles = windows[np.ix_(ys, xs)].reshape(-1, tile_size, tile_size, 3)
+
+    leaf = vegetation_fraction(tiles) >= min_leaf_fraction
+    if not leaf.any():
+        result = predict_disease(image_path)
+        result["tiles"] = {"rows": len(ys), "cols": len(xs), "scored": 0, "skipped": int(leaf.size)}
+        return result
+
+    batch = tiles[leaf].astype(np.float32) / 255.0
+    batch_size = get_inference_config().get("batch_size") or 32
+    probs = model.predict(batch, batch_size=batch_size, verbose=0)
+
+    class_list = list(CLASS_NAMES.keys())
+    healthy = np.array(["healthy" in name for name in class_list])
+    tile_classes = probs.argmax(axis=1)
+    diseased = ~healthy[tile_classes]
+
+    if diseased.mean() >= min_disease_fraction:
+        mass = probs[diseased].sum(axis=0)
+        mass[healthy] = 0
+        class_idx = int(mass.argmax())
+        confidence = float(probs[diseased, class_idx].mean())
+    else:
+        mean = probs.mean(axis=0)
+        class_idx = int(mean.argmax())
+        confidence = float(mean[class_idx])
+
+    # Heatmap grids in tile order; skipped (non-leaf) tiles are None
+    grid_class = [None] * leaf.size
+    grid_confidence = [None] * leaf.size
+    grid_disease = [None] * leaf.size
+    disease_probability = 1.0 - probs[:, healthy].sum(axis=1)
+    for slot, tile_idx in enumerate(np.flatnonzero(leaf)):
+        grid_class[tile_idx] = class_list[tile_classes[slot]]
+        grid_confidence[tile_idx] = round(float(probs[slot, tile_classes[slot]]), 4)
+        grid_disease[tile_idx] = round(float(disease_probability[slot]), 4)
+
+    cols = len(xs)
+    result = _prediction_result(class_idx, confidence)
+    result["tiles"] = {
+        "rows": len(ys),
+        "cols": cols,
+        "tile_size": tile_size,
+        "stride": stride,
+        "image_size": [width, height],
+        "scored": int(leaf.sum()),
+        "skipped": int((~leaf).sum()),
+        "diseased_fraction": round(float(diseased.mean()), 4),
+        "classes": [grid_class[r * cols:(r + 1) * cols] for r in range(len(ys))],
+        "confidence": [grid_confidence[r * cols:(r + 1) * cols] for r in range(len(ys))],
+        "disease_probability": [grid_disease[r * cols:(r + 1) * cols] for r in range(len(ys))],
+    }
+    return result
+
+
+def predict_disease(
+    image_path: str,
+    tiled: bool = False,
+    embed: bool = False,
+    tta: Optional[str] = None
+) -> Dict[str, Any]:
+    """Predict the disease in one image
+
+    With `embed`, the result also carries the penultimate-layer feature
+    vector as `embedding`. `tta` overrides TTA_MODE; augmented views are
+    scored in one batch and their probabilities averaged. Neither applies
+    to tiled predictions.
+    """
+    options = {}
+    if tiled:
+        options["tiled"] = True
+    if embed:
+        options["embed"] = True
+    if tta:
+        options["tta"] = tta
+
+    if INFERENCE_QUEUE:
+        from inference_queue import get_job_queue
+        return get_job_queue(INFERENCE_QUEUE).predict(image_path, options)
+
+    if INFERENCE_SOCKET:
+        from inference_server import request_inference
+        return request_inference(INFERENCE_SOCKET, image_path, options)
+
     try:
-        model = load_keras_model()
-        img_array = preprocess_image(image_path)
+        if tiled:
+            return predict_disease_tiled(image_path)
+
+        with stage("inference.preprocess"):
+            img_array = preprocess_image(image_path)
+            quality = _check_quality(img_array[0])
+        if quality and quality["rejected"]:
+            return _rejected_result(quality)
+
+        tta = tta or TTA_MODE
+        if tta not in TTA_MODES:
+            raise ValueError(f"Unknown TTA mode: {tta}")
 
-        predictions = model.predict(img_array, verbose=0)
-        predicted_idx = int(np.argmax(predictions[0]))
-        confidence = float(predictions[0][predicted_idx])
+        model = load_embedding_model() if embed else load_keras_model()
+        views = tta_views(img_array[0], TTA_AUGMENTATIONS) if tta == "always" else img_array
 
-        class_list = list(CLASS_NAMES.keys())
-        predicted_class = class_list[predicted_idx]
-        predicted_class_display = CLASS_NAMES.get(predicted_class, predicted_class)
+        started = time.perf_counter()
+        with stage("inference.model"):
+            outputs = model.predict(views, verbose=0)
+        _record_inference(time.perf_counter() - started)
+        features, probs = outputs if embed else (None, outputs)
+        first_pass_confidence = float(probs[0].max())
 
-        disease_info = DISEASE_INFO.get(
-            predicted_class,
-            {
-                "treatment": "Consult agricultural expert",
-                "medicine": "Unknown"
+        # Second look only for borderline images: the remaining views in one batch
+        if tta == "auto" and TTA_AUGMENTATIONS > 1 and first_pass_confidence < TTA_CONFIDENCE_THRESHOLD:
+            with stage("inference.tta"):
+                extra = load_keras_model().predict(tta_views(img_array[0], TTA_AUGMENTATIONS)[1:], verbose=0)
+            probs = np.concatenate([probs, extra])
+
+        mean_probs = probs.mean(axis=0)
+        predicted_idx = int(np.argmax(mean_probs))
+        confidence = float(mean_probs[predicted_idx])
+
+        result = _prediction_result(predicted_idx, confidence)
+        if quality:
+            result["quality"] = quality
+        if len(probs) > 1:
+            result["tta"] = {
+                "views": len(probs),
+                "first_pass_confidence": round(first_pass_confidence, 4)
             }
-        )
-
-        return {
-            "predicted_class": predicted_class,
-            "predicted_class_display": predicted_class_display,
-            "confidence": confidence,
-            "treatment": disease_info.get("treatment", ""),
-            "medicine": disease_info.get("medicine", ""),
-            "success": True
-        }
+        if embed:
+            result["embedding"] = features[0].astype(np.float32).tolist()
+        return result
 
     except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "predicted_class": None,
-            "confidence": 0.0,
-            "treatment": "",
-            "medicine": ""
-        }
+        return _failure_result(str(e))
+
+
+def predict_disease_batch(image_paths: List[str]) -> List[Dict[str, Any]]:
+    """Predict several images in one batched forward pass
+
+    Results are in input order; an image that fails to load gets a
+    failure result without failing the rest of the batch.
+    """
+    if INFERENCE_QUEUE:
+        from inference_queue import get_job_queue
+        return get_job_queue(INFERENCE_QUEUE).predict_batch(image_paths)
+
+    if INFERENCE_SOCKET:
+        from inference_server import request_inference_batch
+        return request_inference_batch(INFERENCE_SOCKET, image_paths)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(image_paths)
+    qualities: List[Optional[Dict[str, Any]]] = [None] * len(image_paths)
+    arrays, indices = [], []
+    for i, path in enumerate(image_paths):
+        try:
+            img = preprocess_image(path)[0]
+        except Exception as e:
+            results[i] = _failure_result(str(e))
+            continue
+        qualities[i] = _check_quality(img)
+        if qualities[i] and qualities[i]["rejected"]:
+            results[i] = _rejected_result(qualities[i])
+            continue
+        arrays.append(img)
+        indices.append(i)
+
+    if arrays:
+        try:
+            model = load_keras_model()
+            batch_size = get_inference_config().get("batch_size") or 32
+            started = time.perf_counter()
+            probs = model.predict(np.stack(arrays), batch_size=batch_size, verbose=0)
+            _record_inference(time.perf_counter() - started, len(arrays))
+            class_idx = probs.argmax(axis=1)
+            for row, i in enumerate(indices):
+                results[i] = _prediction_result(int(class_idx[row]), float(probs[row, class_idx[row]]))
+                if qualities[i]:
+                    results[i]["quality"] = qualities[i]
+        except Exception as e:
+            for i in indices:
+                results[i] = _failure_result(str(e))
+
+    return results
 
 
 def get_class_names() -> Dict[str, str]:
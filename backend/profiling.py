@@ -0,0 +1,228 @@
+"""
+On-demand profiling for AgroGuard AI
+Sampling profiler with flamegraph (collapsed stack) output, per-request
+stage timings and a log of the slowest recent requests
+"""
+
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+# Stage timings of the request being handled; None outside a timed request
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+# Leaf frames of threads that are parked waiting for work
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+
+@contextmanager
+def stage(name: str):
+    """Add the wall time of the block to the current request's `name` stage
+
+    A no-op outside a timed request (e.g. in inference workers).
+    """
+    timings = _stages.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+# ---------------- SAMPLING PROFILER ---------------- #
+
+def _short_path(path: str) -> str:
+    marker = "site-packages" + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    try:
+        relative = os.path.relpath(path)
+    except ValueError:
+        return os.path.basename(path)
+    return os.path.basename(path) if relative.startswith("..") else relative
+
+
+class SamplingProfiler:
+    """Sample the stacks of every thread in this process from a background thread
+
+    Nothing runs between sessions; a session lasts a number of seconds or
+    until a number of requests have finished, whichever comes first.
+    Output is in the collapsed stack format read by flamegraph.pl,
+    speedscope and inferno: one `thread;outer;...;inner count` line per
+    distinct stack.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._counts: Dict[Tuple[str, tuple], int] = {}
+        self._samples = 0
+        self._requests_left: Optional[int] = None
+        self._requests_done = 0
+        self._done: Optional[asyncio.Event] = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def _sample_loop(self, interval: float, include_idle: bool):
+        own = threading.get_ident()
+        while not self._stop.wait(interval):
+            names = {t.ident: re.sub(r"[-_ ]?\d+$", "", t.name) for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                leaf = codes[0]
+                if not include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                    continue
+                key = (names.get(thread_id, "thread"), tuple(codes))
+                self._counts[key] = self._counts.get(key, 0) + 1
+            self._samples += 1
+
+    def request_finished(self):
+        """Count a finished request towards a request-bounded session"""
+        if self._requests_left is None:
+            return
+        self._requests_done += 1
+        self._requests_left -= 1
+        if self._requests_left <= 0:
+            self._done.set()
+
+    async def run(self, seconds: float, requests: Optional[int] = None,
+                  interval_ms: float = 5.0, include_idle: bool = False) -> Dict[str, Any]:
+        """Profile for `seconds`, or until `requests` requests finish if that is sooner"""
+        if self.active:
+            raise RuntimeError("A profiling session is already running")
+
+        self._counts, self._samples, self._requests_done = {}, 0, 0
+        self._done = asyncio.Event()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample_loop, args=(interval_ms / 1000.0, include_idle),
+            name="profiler", daemon=True
+        )
+        started = time.perf_counter()
+        self._thread.start()
+        self._requests_left = requests
+        try:
+            await asyncio.wait_for(self._done.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._requests_left = None
+            self._stop.set()
+            thread, self._thread = self._thread, None
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+        return {
+            "seconds": round(time.perf_counter() - started, 3),
+            "samples": self._samples,
+            "requests": self._requests_done,
+            "collapsed": self.collapsed(),
+        }
+
+    def collapsed(self) -> str:
+        """Stacks of the last session in collapsed format, most frequent first"""
+        labels: Dict[Any, str] = {}
+
+        def label(code) -> str:
+            if code not in labels:
+                labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            return labels[code]
+
+        lines = []
+        for (thread_name, codes), count in sorted(self._counts.items(), key=lambda item: -item[1]):
+            frames = [thread_name] + [label(code) for code in reversed(codes)]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+# ---------------- SLOW REQUESTS ---------------- #
+
+class SlowRequestLog:
+    """Ring buffer of the most recent requests slower than `threshold_ms`"""
+
+    def __init__(self, size: int = 50, threshold_ms: float = 500.0):
+        self.threshold_ms = threshold_ms
+        self._entries: deque = deque(maxlen=max(size, 1))
+        self.enabled = size > 0
+
+    def record(self, entry: Dict[str, Any]):
+        if entry["duration_ms"] >= self.threshold_ms:
+            self._entries.append(entry)
+
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return sorted(self._entries, key=lambda entry: -entry["duration_ms"])[:limit]
+
+
+class RequestTimingMiddleware:
+    """Time each HTTP request and its stages for the slow request log
+
+    Also counts finished requests for request-bounded profiling sessions.
+    Paths under `skip_prefix` (the profiling endpoints themselves) are not
+    recorded.
+    """
+
+    def __init__(self, app, slow_log: SlowRequestLog, profiler: SamplingProfiler,
+                 skip_prefix: str = "/admin/"):
+        self.app = app
+        self.slow_log = slow_log
+        self.profiler = profiler
+        self.skip_prefix = skip_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefix):
+            await self.app(scope, receive, send)
+            return
+        if not self.slow_log.enabled:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.profiler.request_finished()
+            return
+
+        timings: Dict[str, float] = {}
+        token = _stages.set(timings)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            _stages.reset(token)
+            self.slow_log.record({
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(duration_ms, 1),
+                "stages": {name: round(ms, 1) for name, ms in timings.items()},
+            })
+            self.profiler.request_finished()
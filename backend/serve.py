@@ -0,0 +1,142 @@
+"""
+Serving launcher for AgroGuard AI
+Run several API workers that share one warmed-up model
+
+Modes:
+    shared      Start inference_server.py once (loads and warms the model),
+                then start N uvicorn workers that forward predictions to it
+                over a Unix socket. Workers never import TensorFlow, so the
+                model's memory and warm-up are paid once per node.
+    in-process  Every uvicorn worker loads and warms its own model copy
+                (the previous behaviour, kept for comparison).
+
+TensorFlow's runtime is not fork-safe once initialised, so the model is not
+preloaded in a parent and forked; a single inference process is used instead.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+    python -m benchmarks.serving_memory   # RSS/PSS and cold start per worker count
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from inference_server import DEFAULT_SOCKET, check_health
+from model_loader import load_inference_config
+
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """Resident (RSS) and proportional (PSS) memory of a process in MB
+
+    PSS splits shared pages between the processes mapping them, so summing
+    it over workers gives the real footprint.
+    """
+    memory = {"rss_mb": 0.0, "pss_mb": 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    memory[f"{key.lower()}_mb"] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def child_pids(pid: int) -> List[int]:
+    """All descendant process ids of `pid` (Linux /proc walk)"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent pid; the command name may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+
+    found, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def start_inference_server(socket_path: str, timeout: float = 300) -> subprocess.Popen:
+    """Start the shared inference server and wait until its model is warm"""
+    env = dict(os.environ)
+    env.pop("INFERENCE_SOCKET", None)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_server.py"),
+         "--socket", socket_path, "--parent-pid", str(os.getpid())],
+        env=env
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Inference server exited with code {server.returncode}")
+        try:
+            check_health(socket_path)
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.terminate()
+    raise TimeoutError("Inference server did not become ready")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run AgroGuard AI with shared model memory")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="API workers; defaults to the CPU count, or the autotuned "
+                             "replica count in in-process mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--mode", choices=["shared", "in-process"], default="shared")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Inference server socket path")
+    args = parser.parse_args()
+
+    # Shared-mode workers only forward requests, so the autotuned replica
+    # count (model copies that fit the cores) applies only when each worker
+    # is itself a replica
+    if args.workers is None:
+        if args.mode == "in-process":
+            args.workers = load_inference_config(mode="replicas").get("workers") or os.cpu_count() or 1
+        else:
+            args.workers = os.cpu_count() or 1
+
+    import uvicorn
+
+    server = None
+    try:
+        if args.mode == "shared":
+            start = time.perf_counter()
+            server = start_inference_server(args.socket)
+            memory = process_memory(server.pid)
+            print(
+                f"[SERVE] Inference server ready in {time.perf_counter() - start:.2f}s "
+                f"(RSS {memory['rss_mb']:.0f} MB)"
+            )
+            os.environ["INFERENCE_SOCKET"] = args.socket
+        else:
+            os.environ["PRELOAD_MODEL"] = "1"
+        # Workers split the node-wide admission limits between them
+        os.environ["API_WORKERS"] = str(args.workers)
+
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
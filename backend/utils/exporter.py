@@ -0,0 +1,146 @@
+"""
+Prediction export for AgroGuard AI
+Stream prediction history as CSV, NDJSON or Parquet in constant memory
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, List, Sequence
+
+EXPORT_COLUMNS = [
+    "id", "user_id", "image_name", "predicted_class",
+    "confidence", "treatment", "medicine", "created_at",
+]
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _csv_chunks(batches: Iterable[Sequence]) -> Iterator[bytes]:
+    """Encode row batches as CSV, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for rows in batches:
+        writer.writerows([tuple(row[c] for c in EXPORT_COLUMNS) for row in rows])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header-only export when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(batches: Iterable[Sequence]) -> Iterator[bytes]:
+    """Encode row batches as newline-delimited JSON"""
+    for rows in batches:
+        lines = [
+            json.dumps({c: row[c] for c in EXPORT_COLUMNS}, separators=(",", ":"))
+            for row in rows
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained between row groups"""
+
+    mode = "wb"
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _require_pyarrow():
+    """Import pyarrow lazily; it is only needed for Parquet export"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow to be installed")
+    return pyarrow, pyarrow.parquet
+
+
+def _parquet_chunks(batches: Iterable[Sequence], compression: str, pa, pq) -> Iterator[bytes]:
+    """Encode row batches as Parquet, one row group per batch"""
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("image_name", pa.string()),
+        ("predicted_class", pa.string()),
+        ("confidence", pa.float64()),
+        ("treatment", pa.string()),
+        ("medicine", pa.string()),
+        ("created_at", pa.string()),
+    ])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for rows in batches:
+            columns = {c: [row[c] for row in rows] for c in EXPORT_COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Gzip a byte stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(batches: Iterable[Sequence], export_format: str, gzip: bool = False) -> Iterator[bytes]:
+    """Stream row batches in the requested format, optionally gzip-compressed
+
+    Parquet is compressed internally, so `gzip` selects its page codec
+    instead of wrapping the file.
+    """
+    if export_format == "csv":
+        chunks = _csv_chunks(batches)
+    elif export_format == "ndjson":
+        chunks = _ndjson_chunks(batches)
+    elif export_format == "parquet":
+        pa, pq = _require_pyarrow()
+        return _parquet_chunks(batches, "gzip" if gzip else "snappy", pa, pq)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    return _gzip_chunks(chunks) if gzip else chunks
@@ -4,12 +4,20 @@ Generate PDF reports for disease predictions
 """
 
 import os
+import copy
+import hashlib
+import time
+import uuid
+from contextlib import nullcontext
 from datetime import datetime
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, Optional
+from PIL import Image as PILImage
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.colors import HexColor, green, white
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak, Flowable
 from reportlab.lib import colors
 
 # Reports directory
@@ -18,6 +26,116 @@ REPORTS_DIR = "static/reports"
 # Create reports directory if it doesn't exist
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
+# Bump whenever the rendered layout changes so cached reports are re-rendered
+REPORT_TEMPLATE_VERSION = 1
+
+# ---------------- STATIC TEMPLATE ---------------- #
+# Styles, table styles and the fixed header/footer are built once at import
+# time; only the per-report fields are laid out on each call.
+
+_STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    textColor=HexColor('#16a34a'),
+    spaceAfter=6,
+    alignment=1,  # Center
+    fontName='Helvetica-Bold'
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_STYLES['Heading2'],
+    fontSize=14,
+    textColor=HexColor('#16a34a'),
+    spaceAfter=12,
+    fontName='Helvetica-Bold'
+)
+
+NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=_STYLES['Normal'],
+    fontSize=11,
+    spaceAfter=6
+)
+
+
+def _label_table_style(label_background: str) -> TableStyle:
+    """Two-column label/value table style with a tinted label column"""
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), HexColor(label_background)),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ])
+
+
+INFO_TABLE_STYLE = _label_table_style('#f0fdf4')
+PREDICTION_TABLE_STYLE = _label_table_style('#d1fae5')
+TREATMENT_TABLE_STYLE = _label_table_style('#fef3c7')
+
+TABLE_COL_WIDTHS = [2*inch, 4*inch]
+
+GRID_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), HexColor('#d1fae5')),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+ROW_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+# Field report columns: thumbnail, disease, confidence, date, image
+FIELD_COL_WIDTHS = [1*inch, 2.2*inch, 1*inch, 1.5*inch, 1.5*inch]
+THUMBNAIL_SIZE = 0.9*inch
+
+FOOTER_TEXT = "This report was automatically generated by AgroGuard AI. Please consult with agricultural experts for additional guidance."
+
+# Pre-parsed paragraphs; shallow-copied per report so concurrent builds never
+# share wrap/split state.
+_HEADER = [
+    Paragraph("AgroGuard AI", TITLE_STYLE),
+    Paragraph("Plant Disease Prediction Report", _STYLES['Heading2']),
+]
+_FOOTER = Paragraph(f"<i>{FOOTER_TEXT}</i>", _STYLES['Normal'])
+
+_HEADINGS = {
+    name: Paragraph(name, HEADING_STYLE)
+    for name in (
+        "Analyzed Image", "Prediction Results", "Treatment Recommendations",
+        "Disease Summary", "Survey Predictions",
+    )
+}
+
+_LABELS = {
+    name: Paragraph(f"<b>{name}</b>", NORMAL_STYLE)
+    for name in (
+        "User Name:", "Report Date:", "Detected Disease:", "Confidence Score:",
+        "Recommended Treatment:", "Suggested Medicine:",
+        "Survey Period:", "Total Predictions:",
+    )
+}
+
+
+def _label_table(rows, table_style: TableStyle) -> Table:
+    """Build a label/value table from (label, value) pairs"""
+    data = [
+        [copy.copy(_LABELS[label]), Paragraph(value, NORMAL_STYLE)]
+        for label, value in rows
+    ]
+    table = Table(data, colWidths=TABLE_COL_WIDTHS)
+    table.setStyle(table_style)
+    return table
+
 
 def generate_pdf_report(
     username: str,
@@ -35,121 +153,54 @@ def generate_pdf_report(
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     # Create filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"report_{timestamp}.pdf"
+    filename = _unique_filename()
     filepath = os.path.join(REPORTS_DIR, filename)
     
     # Create PDF document
     doc = SimpleDocTemplate(filepath, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
     
-    # Container for PDF elements
-    elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=HexColor('#16a34a'),
-        spaceAfter=6,
-        alignment=1,  # Center
-        fontName='Helvetica-Bold'
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=HexColor('#16a34a'),
-        spaceAfter=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6
-    )
-    
     # Header
-    elements.append(Paragraph("AgroGuard AI", title_style))
-    elements.append(Paragraph("Plant Disease Prediction Report", styles['Heading2']))
+    elements = [copy.copy(p) for p in _HEADER]
     elements.append(Spacer(1, 0.2*inch))
     
     # User and Date Information
-    info_data = [
-        [Paragraph("<b>User Name:</b>", normal_style), Paragraph(username, normal_style)],
-        [Paragraph("<b>Report Date:</b>", normal_style), Paragraph(date, normal_style)],
-    ]
-    
-    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), HexColor('#f0fdf4')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(info_table)
+    elements.append(_label_table(
+        [("User Name:", username), ("Report Date:", date)],
+        INFO_TABLE_STYLE
+    ))
     elements.append(Spacer(1, 0.2*inch))
     
     # Image section
     if os.path.exists(image_path):
         try:
-            elements.append(Paragraph("Analyzed Image", heading_style))
+            elements.append(copy.copy(_HEADINGS["Analyzed Image"]))
             img = Image(image_path, width=3*inch, height=3*inch)
             elements.append(img)
             elements.append(Spacer(1, 0.2*inch))
         except Exception as e:
-            elements.append(Paragraph(f"<i>Image could not be displayed: {str(e)}</i>", normal_style))
+            elements.append(Paragraph(f"<i>Image could not be displayed: {str(e)}</i>", NORMAL_STYLE))
             elements.append(Spacer(1, 0.2*inch))
     
     # Prediction Results
-    elements.append(Paragraph("Prediction Results", heading_style))
-    
-    prediction_data = [
-        [Paragraph("<b>Detected Disease:</b>", normal_style), Paragraph(predicted_class_display, normal_style)],
-        [Paragraph("<b>Confidence Score:</b>", normal_style), Paragraph(f"{confidence*100:.2f}%", normal_style)],
-    ]
-    
-    pred_table = Table(prediction_data, colWidths=[2*inch, 4*inch])
-    pred_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), HexColor('#d1fae5')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(pred_table)
+    elements.append(copy.copy(_HEADINGS["Prediction Results"]))
+    elements.append(_label_table(
+        [("Detected Disease:", predicted_class_display),
+         ("Confidence Score:", f"{confidence*100:.2f}%")],
+        PREDICTION_TABLE_STYLE
+    ))
     elements.append(Spacer(1, 0.2*inch))
     
     # Treatment Recommendations
-    elements.append(Paragraph("Treatment Recommendations", heading_style))
-    
-    treatment_data = [
-        [Paragraph("<b>Recommended Treatment:</b>", normal_style), Paragraph(treatment, normal_style)],
-        [Paragraph("<b>Suggested Medicine:</b>", normal_style), Paragraph(medicine, normal_style)],
-    ]
-    
-    treatment_table = Table(treatment_data, colWidths=[2*inch, 4*inch])
-    treatment_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), HexColor('#fef3c7')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(treatment_table)
+    elements.append(copy.copy(_HEADINGS["Treatment Recommendations"]))
+    elements.append(_label_table(
+        [("Recommended Treatment:", treatment),
+         ("Suggested Medicine:", medicine)],
+        TREATMENT_TABLE_STYLE
+    ))
     elements.append(Spacer(1, 0.3*inch))
     
     # Footer
-    footer_text = "This report was automatically generated by AgroGuard AI. Please consult with agricultural experts for additional guidance."
-    elements.append(Paragraph(f"<i>{footer_text}</i>", styles['Normal']))
+    elements.append(copy.copy(_FOOTER))
     
     # Build PDF
     doc.build(elements)
@@ -157,6 +208,207 @@ def generate_pdf_report(
     return filename, filepath
 
 
+# Maps an image path to a context manager yielding a readable local path
+ImageResolver = Callable[[str], ContextManager[str]]
+
+
+class _Thumbnail(Flowable):
+    """Downscaled image that is only decoded when its page is drawn
+
+    `resolve` (e.g. maintenance.local_copy) is entered around the decode,
+    so images moved out of the upload directory can still be read.
+    """
+
+    def __init__(self, image_path: str, size: float = THUMBNAIL_SIZE,
+                 resolve: Optional[ImageResolver] = None):
+        super().__init__()
+        self.image_path = image_path
+        self.size = size
+        self.resolve = resolve or nullcontext
+
+    def wrap(self, availWidth, availHeight):
+        return self.size, self.size
+
+    def draw(self):
+        try:
+            with self.resolve(self.image_path) as path:
+                if not os.path.exists(path):
+                    print(f"[REPORTS] Thumbnail skipped, image not found: {self.image_path}")
+                    return
+                with PILImage.open(path) as img:
+                    pixels = int(self.size * 2)
+                    img.thumbnail((pixels, pixels))
+                    thumb = img.convert("RGB")
+        except Exception as e:
+            print(f"[REPORTS] Thumbnail skipped for {self.image_path}: {str(e)}")
+            return
+        self.canv.drawImage(
+            ImageReader(thumb), 0, 0, width=self.size, height=self.size,
+            preserveAspectRatio=True, anchor='c'
+        )
+
+
+class _LazyFlowables(list):
+    """Flowable list that is refilled from a generator as the layout consumes it
+
+    The platypus build loop only ever looks at the head of the list and
+    checks its length before every step, so topping up in ``__len__`` keeps
+    just a small window of flowables alive instead of the whole document.
+    """
+
+    def __init__(self, source: Iterator, lookahead: int = 8):
+        super().__init__()
+        self._source = source
+        self._lookahead = lookahead
+
+    def __len__(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return list.__len__(self)
+
+
+def _field_report_flowables(
+    username: str,
+    predictions: Iterable[Dict],
+    disease_counts: Dict[str, int],
+    image_dir: str,
+    period: str,
+    class_names: Dict[str, str],
+    resolve_image: Optional[ImageResolver] = None
+) -> Iterator[Flowable]:
+    """Yield the flowables of a consolidated field report in page order"""
+    total = sum(disease_counts.values())
+
+    # Header
+    yield copy.copy(_HEADER[0])
+    yield Paragraph("Field Survey Report", _STYLES['Heading2'])
+    yield Spacer(1, 0.2*inch)
+    yield _label_table(
+        [("User Name:", username),
+         ("Report Date:", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+         ("Survey Period:", period),
+         ("Total Predictions:", str(total))],
+        INFO_TABLE_STYLE
+    )
+    yield Spacer(1, 0.2*inch)
+
+    # Disease count summary
+    yield copy.copy(_HEADINGS["Disease Summary"])
+    summary_data = [["Disease", "Count", "Share"]]
+    for disease, count in sorted(disease_counts.items(), key=lambda item: -item[1]):
+        summary_data.append([
+            Paragraph(class_names.get(disease, disease), NORMAL_STYLE),
+            str(count),
+            f"{count / total * 100:.1f}%" if total else "-",
+        ])
+    summary_table = Table(summary_data, colWidths=[3.5*inch, 1*inch, 1*inch], repeatRows=1)
+    summary_table.setStyle(GRID_TABLE_STYLE)
+    yield summary_table
+    yield Spacer(1, 0.3*inch)
+
+    # One small table per prediction so rows are laid out as they stream in
+    yield copy.copy(_HEADINGS["Survey Predictions"])
+    header = Table([["Image", "Disease", "Confidence", "Date", "File"]], colWidths=FIELD_COL_WIDTHS)
+    header.setStyle(GRID_TABLE_STYLE)
+    yield header
+
+    for prediction in predictions:
+        row = Table([[
+            _Thumbnail(os.path.join(image_dir, prediction["image_name"]), resolve=resolve_image),
+            Paragraph(class_names.get(prediction["predicted_class"], prediction["predicted_class"]), NORMAL_STYLE),
+            f"{prediction['confidence']*100:.1f}%",
+            Paragraph(str(prediction["created_at"]), NORMAL_STYLE),
+            Paragraph(prediction["image_name"], NORMAL_STYLE),
+        ]], colWidths=FIELD_COL_WIDTHS)
+        row.setStyle(ROW_TABLE_STYLE)
+        yield row
+
+    yield Spacer(1, 0.3*inch)
+    yield copy.copy(_FOOTER)
+
+
+def generate_field_report(
+    username: str,
+    predictions: Iterable[Dict],
+    disease_counts: Dict[str, int],
+    output,
+    image_dir: str,
+    period: str = "",
+    class_names: Optional[Dict[str, str]] = None,
+    resolve_image: Optional[ImageResolver] = None
+):
+    """Generate one consolidated PDF for many predictions
+
+    `predictions` may be a lazy iterator (e.g. a database cursor); rows are
+    pulled only as pages are laid out and thumbnails are decoded on draw.
+    `output` is a file path or a binary file-like object. `resolve_image`
+    locates thumbnails that are no longer under `image_dir`.
+    """
+    doc = SimpleDocTemplate(output, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    flowables = _field_report_flowables(
+        username, predictions, disease_counts, image_dir, period, class_names or {}, resolve_image
+    )
+    doc.build(_LazyFlowables(flowables))
+
+
+def _unique_filename() -> str:
+    """Timestamped report filename with a random suffix so renders never collide"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"report_{timestamp}_{uuid.uuid4().hex[:8]}.pdf"
+
+
+def compute_render_key(
+    username: str,
+    image_path: str,
+    predicted_class_display: str,
+    confidence: float,
+    treatment: str,
+    medicine: str,
+    date: str,
+    archived_image_mtime: Optional[float] = None
+) -> str:
+    """Fingerprint of everything that ends up in a rendered report
+
+    `archived_image_mtime` stands in for the image's modification time once
+    the image has been moved into an archive bundle.
+    """
+    image_mtime = os.path.getmtime(image_path) if os.path.exists(image_path) else archived_image_mtime
+    parts = [
+        REPORT_TEMPLATE_VERSION, username, image_path, image_mtime,
+        predicted_class_display, f"{confidence:.6f}", treatment, medicine, date,
+    ]
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def cleanup_orphaned_reports(referenced_paths, min_age_seconds: int = 3600) -> int:
+    """Delete PDFs in the reports directory that no reports row points to
+
+    Files younger than `min_age_seconds` are kept so a render whose row has
+    not been committed yet is never removed.
+    """
+    referenced = {os.path.abspath(p) for p in referenced_paths}
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+
+    for entry in os.scandir(REPORTS_DIR):
+        if not entry.is_file() or not entry.name.endswith(".pdf"):
+            continue
+        if os.path.abspath(entry.path) in referenced:
+            continue
+        try:
+            if entry.stat().st_mtime > cutoff:
+                continue
+            os.remove(entry.path)
+            removed += 1
+        except OSError:
+            continue
+
+    return removed
+
+
 def get_reports_directory() -> str:
     """Get the reports directory path"""
     return REPORTS_DIR
@@ -0,0 +1,227 @@
+"""
+Write-behind persistence for AgroGuard AI
+Queue prediction inserts and commit them in grouped transactions
+"""
+
+import atexit
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from database import reserve_prediction_ids, save_predictions_batch, set_writer_low_mark, remove_writer
+
+_STOP = object()
+
+
+class PredictionWriteBehind:
+    """Assign prediction ids up front and commit rows in batches
+
+    Ids come from blocks reserved in the database, so `submit` only touches
+    SQLite once per `id_block_size` predictions. A background thread
+    commits queued rows every `flush_rows` rows or `flush_interval_ms`
+    milliseconds, whichever comes first, turning one fsync per prediction
+    into one per batch. Rows not yet committed are readable through
+    `get_pending`.
+
+    With every commit, and every `heartbeat_seconds` while idle, the writer
+    records its low mark: the oldest `created_at` it may still commit.
+    The analytics rollup stops short of it, so rows held back by a locked
+    database are still counted once they land.
+
+    A batch that finds the database locked is retried up to `max_retries`
+    times with backoff; any other error drops it.
+    """
+
+    def __init__(self, flush_rows: int = 64, flush_interval_ms: int = 50, id_block_size: int = 100,
+                 heartbeat_seconds: float = 15.0, max_retries: int = 20):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.id_block_size = id_block_size
+        self.heartbeat = heartbeat_seconds
+        self.max_retries = max_retries
+        self.writer_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        # _lock guards the pending rows; _id_lock is held across block
+        # reservations, which can wait on a busy database
+        self._lock = threading.Lock()
+        self._id_lock = threading.Lock()
+        self._next_id = 0
+        self._block_end = 0
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def start(self):
+        """Start the background flusher"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="prediction-write-behind", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def submit(
+        self,
+        user_id: int,
+        image_name: str,
+        predicted_class: str,
+        confidence: float,
+        treatment: str,
+        medicine: str
+    ) -> int:
+        """Queue a prediction and return its id without waiting for the commit
+
+        Reserving a new id block waits on the database, so call this from a
+        worker thread rather than the event loop.
+        """
+        if self._closed:
+            raise RuntimeError("Prediction writer is closed")
+        with self._id_lock:
+            if self._next_id >= self._block_end:
+                self._next_id = reserve_prediction_ids(self.id_block_size)
+                self._block_end = self._next_id + self.id_block_size
+            prediction_id = self._next_id
+            self._next_id += 1
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Prediction writer is closed")
+            row = {
+                "id": prediction_id,
+                "user_id": user_id,
+                "image_name": image_name,
+                "predicted_class": predicted_class,
+                "confidence": confidence,
+                "treatment": treatment,
+                "medicine": medicine,
+                # Same format and UTC clock as SQLite's CURRENT_TIMESTAMP
+                "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self._pending[prediction_id] = row
+
+        self._queue.put(row)
+        return prediction_id
+
+    def get_pending(self, prediction_id: int) -> Optional[Dict[str, Any]]:
+        """Get a queued prediction that has not been committed yet"""
+        with self._lock:
+            row = self._pending.get(prediction_id)
+            return dict(row) if row else None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every row submitted so far is committed"""
+        if self._thread is None or not self._thread.is_alive():
+            return not self._pending
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Commit everything still queued and stop the flusher"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            try:
+                remove_writer(self.writer_id)
+            except Exception as e:
+                print(f"[WRITE-BEHIND] ERROR: writer not unregistered: {str(e)}")
+
+    # ---------------- FLUSHER THREAD ---------------- #
+
+    def _low_mark(self, flushing: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Oldest created_at of the rows still pending once `flushing` is committed"""
+        skip = {row["id"] for row in flushing or []}
+        with self._lock:
+            waiting = [row["created_at"] for row_id, row in self._pending.items() if row_id not in skip]
+            return min(waiting, default=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def _publish_low_mark(self):
+        try:
+            set_writer_low_mark(self.writer_id, self._low_mark())
+        except Exception as e:
+            # Stale low mark only delays the rollup
+            print(f"[WRITE-BEHIND] Low mark not updated: {str(e)}")
+
+    def _run(self):
+        self._publish_low_mark()
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.heartbeat)
+            except queue.Empty:
+                self._publish_low_mark()
+                continue
+            batch: List[Dict[str, Any]] = []
+            waiters: List[threading.Event] = []
+            deadline = time.monotonic() + self.flush_interval
+
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+
+                if stopping or waiters or len(batch) >= self.flush_rows:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            if stopping:
+                # Drain whatever was queued before close()
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        delay = 0.01
+        for attempt in range(self.max_retries + 1):
+            try:
+                save_predictions_batch(batch, self.writer_id, self._low_mark(batch))
+                break
+            except sqlite3.OperationalError as e:
+                # Only a busy/locked database is worth waiting for; a missing
+                # table, I/O error or read-only file will not go away
+                transient = "locked" in str(e) or "busy" in str(e)
+                if not transient or attempt == self.max_retries:
+                    ids = [row["id"] for row in batch]
+                    print(f"[WRITE-BEHIND] ERROR: dropped predictions {ids}: {str(e)}")
+                    break
+                print(f"[WRITE-BEHIND] Retrying batch of {len(batch)}: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+            except Exception as e:
+                ids = [row["id"] for row in batch]
+                print(f"[WRITE-BEHIND] ERROR: dropped predictions {ids}: {str(e)}")
+                break
+
+        with self._lock:
+            for row in batch:
+                self._pending.pop(row["id"], None)